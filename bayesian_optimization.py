@@ -1,12 +1,28 @@
 import numpy as np
 import random
-np.random.seed(40) 
+np.random.seed(40)
 from GPyOpt.methods import BayesianOptimization
+from GPyOpt.core.task.objective import SingleObjective
+from GPyOpt.core.task.space import Design_space
+from GPyOpt.experiment_design import initial_design
+import parallel
 import sys
+import time
+
+
+class BatchObjective(SingleObjective):
+    '''
+    GPyOpt objective handing a whole batch of locations to the cost function in one call
+    (the default SingleObjective evaluates the rows one by one).
+    '''
+    def evaluate(self, x):
+        start_time = time.time()
+        f_evals = self.func(x)
+        return f_evals, [(time.time() - start_time) / x.shape[0]] * x.shape[0]
 
 
 class BayesOpt:
-    def __init__(self, configs, Obs, starttime, timespan, selection, plan):
+    def __init__(self, configs, Obs, starttime, timespan, selection, plan, trace = None, history = None, warm_start = 0, warm_budget = 1.0):
         super(BayesOpt, self).__init__()
         self.obs = Obs
         self.start_time = starttime
@@ -14,24 +30,49 @@ class BayesOpt:
         self.selection = selection
         self.plan = plan
         self.configs = configs
+        self.trace = trace # profiling.EvaluationTrace receiving every evaluation, if given
+        self.history = history # history.HistoryStore recording every evaluation, if given
         self.domain = [{'name': 'coeffA', 'type': 'continuous', 'domain': tuple(self.configs['coeffA'])},
                         {'name': 'coeffB1', 'type': 'continuous', 'domain': tuple(self.configs['coeffB1'])},
                         {'name': 'coeffB2', 'type': 'continuous', 'domain': tuple(self.configs['coeffB2'])},
                         {'name': 'coeffNone', 'type': 'continuous', 'domain': tuple(self.configs['coeffNone'])}]
-        self.build_opt = BayesianOptimization(f = self.cost_function, domain = self.domain, 
+        # batch_size points are proposed per iteration and evaluated by num_workers processes (the local penalization
+        # evaluator of GPyOpt 1.2.6 fails with recent scipy in estimate_L, see evaluator_type in config.yml)
+        self.batch_size = self.configs['batch_size']
+        self.evaluator_type = self.configs['evaluator_type'] if self.batch_size > 1 else 'sequential'
+        self.pool = parallel.EvaluationPool(self.obs, self.configs['num_workers']) if self.configs['num_workers'] > 1 else None
+        num_init = max(5, self.batch_size)
+        X_known, Y_known, X_new = np.zeros((0, 4)), np.zeros((0, 1)), np.zeros((0, 4))
+        self.max_iter = self.configs['max_iter']
+        if self.history is not None and warm_start > 0 and self.history.has_runs(self.plan, self.timespan, self.selection):
+            # known scores (same catalogue and start) are reused, the best parameters of earlier runs are re-evaluated,
+            # and they replace most of the exploration of a cold start (warm_budget of the iterations)
+            X_known, Y_known, X_new = self.history.warm_start(self.start_time, self.plan, self.timespan, self.selection, warm_start,
+                                                              [d['domain'] for d in self.domain])
+            self.max_iter = max(1, int(round(self.max_iter * warm_budget)))
+        X_init = np.concatenate([X_new, initial_design('random', Design_space(self.domain), max(0, num_init - len(X_known) - len(X_new)))])
+        Y_init = self.cost_function(X_init) if len(X_init) > 0 else np.zeros((0, 1))
+        sign = -1 if self.configs['maximize'] else 1 # GPyOpt minimizes -f when maximizing, the known scores are given the same sign
+        self.build_opt = BayesianOptimization(f = self.cost_function, domain = self.domain,
+                                                X = np.concatenate([X_known, X_init]), Y = sign * np.concatenate([Y_known, Y_init]),
                                                 acquisition_type = self.configs['acquisition_type'],
-                                                acquisition_weight = self.configs['acquisition_weight'], 
-                                                maximize = self.configs['maximize'])
-    
+                                                acquisition_weight = self.configs['acquisition_weight'],
+                                                maximize = self.configs['maximize'],
+                                                batch_size = self.batch_size,
+                                                evaluator_type = self.evaluator_type)
+        self.build_opt.objective = BatchObjective(self.build_opt._sign(self.cost_function))
+
     def cost_function(self, x):
         x = np.atleast_2d(x)
         fs = np.zeros((x.shape[0],1))
-        for i in range(x.shape[0]):
-            score = self.obs.simulate_schedule(start = self.start_time, timespan = self.timespan, 
-                                                method = self.selection, 
-                                                sb_value = [x[i,0], x[i,1], x[i,2], x[i,3]], plan = self.plan)
-            fs[i] = score
+        tasks = [{'start': self.start_time, 'timespan': self.timespan, 'method': self.selection,
+                  'sb_value': [x[i,0], x[i,1], x[i,2], x[i,3]], 'plan': self.plan} for i in range(x.shape[0])]
+        fs[:,0] = parallel.evaluate_tasks(self.obs, self.pool, tasks, self.trace, self.history)
         return fs
-    
+
     def optimize(self):
-        self.build_opt.run_optimization(max_iter=self.configs['max_iter'])
+        try:
+            self.build_opt.run_optimization(max_iter=self.max_iter)
+        finally:
+            if self.pool is not None:
+                self.pool.close()
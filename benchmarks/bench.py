@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import yaml
+import katpoint
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import observation as Obs
+import synthetic
+
+
+def timings(function, repeat):
+    '''
+    This routine calls function repeat times and returns the wall times (seconds).
+    '''
+    times = []
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        function(i)
+        times.append(time.perf_counter() - start_time)
+    return np.array(times)
+
+
+def timing_result(times, per_call = 1):
+    times = np.asarray(times) / per_call
+    return {'unit': 's', 'better': 'lower', 'value': float(np.median(times)), 'min': float(times.min()), 'repeat': len(times)}
+
+
+def rate_result(evaluations, seconds):
+    return {'unit': 'evaluations/s', 'better': 'higher', 'value': evaluations / seconds,
+            'evaluations': evaluations, 'seconds': seconds}
+
+
+def bench_observation(configs, args):
+    '''
+    This routine times the construction of Observation (first with the catalogue compiled from the csv files,
+    then loaded from the compiled cache), get_obs_at_time and check_day_night at sample times of the long plan,
+    and simulate_schedule over both plans with random sb_value (as proposed by the optimizers).
+    '''
+    results = {}
+    start_time = time.perf_counter()
+    obs = Obs.Observation(configs, args)
+    results['observation_startup_cold'] = timing_result([time.perf_counter() - start_time])
+    results['observation_startup'] = timing_result(timings(lambda i: Obs.Observation(configs, args), args.repeat))
+    start = katpoint.Timestamp(args.start).secs
+    end = start + configs['plan']['long'] * 3600
+    obs.ephemeris.extend(start, end)
+    days = np.random.default_rng(args.seed).uniform(start, end, args.samples)
+    results['check_day_night'] = timing_result(timings(lambda i: [obs.check_day_night(day) for day in days], args.repeat), len(days))
+    pools = [obs.check_day_night(day) for day in days]
+    data = {'daytime': pd.concat([obs.data_day, obs.data_avsrss], axis = 0), 'nighttime': pd.concat([obs.data_night, obs.data_avsrss], axis = 0)}
+    results['get_obs_at_time'] = timing_result(timings(lambda i: [obs.get_obs_at_time(day, data[day_time], day_time, sunrise, sunset)
+                                                                  for day, (day_time, sunrise, sunset) in zip(days, pools)], args.repeat), len(days))
+    sb_values = np.random.default_rng(args.seed).uniform(-10, 50, (args.repeat, 4))
+    for plan in ['short', 'long']:
+        simulate = lambda i: obs.simulate_schedule(start = args.start, timespan = configs['plan'][plan], method = 'greedy',
+                                                   sb_value = list(sb_values[i]), plan = plan)
+        results['simulate_schedule_%s' % plan] = timing_result(timings(simulate, args.repeat))
+    return obs, results
+
+
+def bench_optimizers(configs, obs, args, store = None):
+    '''
+    This routine runs short BayesOpt and GeneticAlgo optimizations (short plan, genetic algorithm in package mode)
+    and returns their end-to-end throughput, in evaluations of the cost function per second. The evaluations are
+    recorded in store (a history.HistoryStore) if given, as in main.py. An optimizer whose package cannot be
+    imported is skipped.
+    '''
+    results = {}
+    try:
+        import bayesian_optimization as bo
+        bo_configs = dict(configs['bayesopt'], max_iter = args.bo_iter)
+        start_time = time.perf_counter()
+        bayesopt = bo.BayesOpt(bo_configs, obs, args.start, configs['plan']['short'], 'greedy', 'short', history = store)
+        bayesopt.optimize()
+        results['bayesopt_rate'] = rate_result(len(bayesopt.build_opt.Y), time.perf_counter() - start_time)
+    except ImportError as error:
+        print('skipping BayesOpt: %s' % error)
+    try:
+        import genetic_algorithm as ga
+        ga_configs = dict(configs['geneticalgo'], mode = 'package', params = dict(configs['geneticalgo']['params'], max_num_iteration = args.ga_iter))
+        start_time = time.perf_counter()
+        geneticalgo = ga.GeneticAlgo(ga_configs, obs, args.start, configs['plan']['short'], 'greedy', 'short', history = store)
+        function, evaluations = geneticalgo.model.f, []
+        def counted(x):
+            evaluations.append(len(np.atleast_2d(x)))
+            return function(x)
+        geneticalgo.model.f = counted
+        geneticalgo.optimize()
+        results['geneticalgo_rate'] = rate_result(sum(evaluations), time.perf_counter() - start_time)
+    except ImportError as error:
+        print('skipping GeneticAlgo: %s' % error)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''
+    This routine compares results with a baseline (same format) and returns the regressions: benchmarks
+    slower (lower throughput) than the baseline by more than the relative tolerance.
+    '''
+    regressions = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['value'] / baseline[name]['value']
+        if (result['better'] == 'lower' and ratio > 1 + tolerance) or (result['better'] == 'higher' and ratio < 1 / (1 + tolerance)):
+            regressions[name] = {'value': result['value'], 'baseline': baseline[name]['value'], 'ratio': ratio}
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scheduling benchmarks on a synthetic catalogue')
+    parser.add_argument('--num-sbs', type = int, default = 500, help = 'number of SBs of the synthetic catalogue')
+    parser.add_argument('--seed', type = int, default = 1, help = 'random seed of the catalogue and of the sample times/sb_value')
+    parser.add_argument('--lst', type = str, default = 'uniform', help = 'distribution of the LST windows: uniform or clustered')
+    parser.add_argument('--window', type = float, nargs = 2, default = [1, 12], help = 'min and max width of the LST windows (hours)')
+    parser.add_argument('--start', type = str, default = '2024-10-07 06:00:00', help = 'start time of the plans')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'repetitions of each timing')
+    parser.add_argument('--samples', type = int, default = 200, help = 'sample times for get_obs_at_time and check_day_night')
+    parser.add_argument('--bo-iter', type = int, default = 5, help = 'iterations of the BayesOpt benchmark')
+    parser.add_argument('--ga-iter', type = int, default = 2, help = 'iterations of the GeneticAlgo benchmark')
+    parser.add_argument('--skip-optimizers', action = 'store_true', help = 'do not run the BayesOpt/GeneticAlgo benchmarks')
+    parser.add_argument('--no-cache', action = 'store_true', help = 'disable the decision cache and the checkpoints (raw engine timings)')
+    parser.add_argument('--workdir', type = str, default = None, help = 'directory of the synthetic catalogue (temporary by default)')
+    parser.add_argument('--output', type = str, default = None, help = 'json file of the results (stdout by default)')
+    parser.add_argument('--baseline', type = str, default = None, help = 'json file of earlier results to compare with')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'relative slowdown tolerated before reporting a regression')
+    args = parser.parse_args()
+    workdir = args.workdir if args.workdir is not None else tempfile.mkdtemp(prefix = 'scheduling-bench-')
+    configs = yaml.safe_load(open(os.path.join(ROOT, 'config.yml')))
+    configs.update(synthetic.generate_catalogue(workdir, args.num_sbs, args.seed, args.lst, args.window))
+    configs['catalogue_cache'] = os.path.join(workdir, 'cache')
+    if args.no_cache:
+        configs['simulation'] = dict(configs.get('simulation', {}), decision_cache = 0, checkpoints = 0)
+    obs, results = bench_observation(configs, args)
+    if not args.skip_optimizers:
+        import history
+        store = history.HistoryStore(os.path.join(workdir, 'history.sqlite'), obs.catalogue_hash)
+        results.update(bench_optimizers(configs, obs, args, store))
+        store.close()
+    report = {'metadata': {'num_sbs': args.num_sbs, 'seed': args.seed, 'lst': args.lst, 'window': args.window,
+                           'start': args.start, 'plan': configs['plan'], 'simulation': configs.get('simulation', {}),
+                           'python': platform.python_version(), 'machine': platform.machine(), 'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+              'results': results}
+    status = 0
+    if args.baseline is not None:
+        with open(args.baseline) as fp:
+            report['regressions'] = compare(results, json.load(fp)['results'], args.tolerance)
+        status = 1 if len(report['regressions']) > 0 else 0
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=4)
+    print(json.dumps(report, indent=4))
+    sys.exit(status)
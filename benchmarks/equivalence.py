@@ -0,0 +1,100 @@
+import numpy as np
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import yaml
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import observation as Obs
+import synthetic
+from engine import SCHEDULE_COLUMNS
+
+
+NUMERIC_COLUMNS = ['id', 'priority', 'start_secs', 'duration_secs']
+
+
+def schedule_difference(table, reference):
+    '''
+    This routine returns the first difference between two schedule tables (column and row), None if they are identical.
+    '''
+    if len(table) != len(reference):
+        return 'length %d != %d' % (len(table), len(reference))
+    for column in SCHEDULE_COLUMNS:
+        if column in NUMERIC_COLUMNS:
+            values, expected = table[column].to_numpy(dtype=float), reference[column].to_numpy(dtype=float)
+        else:
+            values, expected = table[column].astype(str).to_numpy(), reference[column].astype(str).to_numpy()
+        rows = np.flatnonzero(values != expected)
+        if len(rows) > 0:
+            return '%s at row %d: %s != %s' % (column, rows[0], values[rows[0]], expected[rows[0]])
+    return None
+
+
+def observation(configs, args, **simulation):
+    configs = copy.deepcopy(configs)
+    configs['simulation'] = dict(configs.get('simulation', {}), **simulation)
+    return Obs.Observation(configs, args)
+
+
+def check(name, result, reference):
+    '''
+    This routine compares two outcomes of simulate_schedule (optim = False) and prints the verdict.
+    '''
+    difference = 'counts %s != %s' % (result[:4], reference[:4]) if tuple(result[:4]) != tuple(reference[:4]) else schedule_difference(result[4], reference[4])
+    print('%-60s %s' % (name, 'ok' if difference is None else 'MISMATCH: %s' % difference))
+    return difference is None
+
+
+def check_equivalence(configs, args):
+    '''
+    This routine checks that the faster paths reproduce the reference simulations exactly (same schedule table and counts):
+    array engine against the pandas implementation (greedy and seeded stochastic selections), decision cache and
+    checkpoints against plain array simulations (with sb_value revisited or rescaled, as the optimizers do),
+    and event idle advance against fixed idle advance.
+    '''
+    plain = observation(configs, args, engine = 'array', idle_advance = 'fixed', decision_cache = 0, checkpoints = 0)
+    pandas = observation(configs, args, engine = 'pandas', idle_advance = 'fixed', decision_cache = 0, checkpoints = 0)
+    cached = observation(configs, args, engine = 'array', idle_advance = 'fixed')
+    event = observation(configs, args, engine = 'array', idle_advance = 'event', decision_cache = 0, checkpoints = 0)
+    rng = np.random.default_rng(args.seed)
+    sb_values = [[4, 3, 2, 1]] + rng.uniform(-10, 50, (args.num_values - 1, 4)).tolist()
+    ok = True
+    for sb_value in sb_values:
+        kwargs = {'start': args.start, 'timespan': args.hours, 'sb_value': sb_value, 'optim': False}
+        ok &= check('array vs pandas, greedy, %s' % np.round(sb_value, 2), plain.simulate_schedule(**kwargs), pandas.simulate_schedule(**kwargs))
+        ok &= check('array vs pandas, stochastic (seed %d)' % args.seed, plain.simulate_schedule(method = 'stochastic', seed = args.seed, **kwargs),
+                    pandas.simulate_schedule(method = 'stochastic', seed = args.seed, **kwargs))
+    for plan in ['short', 'long']:
+        # revisited and rescaled sb_value (same picks) go through the decision cache, the others resume from checkpoints
+        for sb_value in sb_values + [list(2.0 * np.array(sb_values[0]))] + sb_values[:2]:
+            kwargs = {'start': args.start, 'timespan': configs['plan'][plan], 'sb_value': sb_value, 'plan': plan}
+            reference = plain.simulate_schedule(optim = False, **kwargs)
+            ok &= check('cache/checkpoints vs plain, %s plan, %s' % (plan, np.round(sb_value, 2)), cached.simulate_schedule(optim = False, **kwargs), reference)
+            ok &= check('event vs fixed idle advance, %s plan, %s' % (plan, np.round(sb_value, 2)), event.simulate_schedule(optim = False, **kwargs), reference)
+            if cached.simulate_schedule(optim = True, **kwargs) != plain.simulate_schedule(optim = True, **kwargs):
+                print('%-60s MISMATCH: score' % ('cache/checkpoints vs plain, %s plan' % plan))
+                ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Equivalence of the simulation paths on a synthetic catalogue')
+    parser.add_argument('--num-sbs', type = int, default = 200, help = 'number of SBs of the synthetic catalogue')
+    parser.add_argument('--seed', type = int, default = 1, help = 'random seed of the catalogue, of the sb_value and of the stochastic selection')
+    parser.add_argument('--lst', type = str, default = 'clustered', help = 'distribution of the LST windows: uniform or clustered')
+    parser.add_argument('--window', type = float, nargs = 2, default = [1, 12], help = 'min and max width of the LST windows (hours)')
+    parser.add_argument('--start', type = str, default = '2024-10-07 06:00:00', help = 'start time of the plans')
+    parser.add_argument('--hours', type = float, default = 24 * 7, help = 'horizon (hours) of the comparisons with the pandas implementation')
+    parser.add_argument('--num-values', type = int, default = 3, help = 'number of sb_value compared (the first is the baseline [4, 3, 2, 1])')
+    parser.add_argument('--workdir', type = str, default = None, help = 'directory of the synthetic catalogue (temporary by default)')
+    args = parser.parse_args()
+    workdir = args.workdir if args.workdir is not None else tempfile.mkdtemp(prefix = 'scheduling-equivalence-')
+    configs = yaml.safe_load(open(os.path.join(ROOT, 'config.yml')))
+    configs.update(synthetic.generate_catalogue(workdir, args.num_sbs, args.seed, args.lst, args.window))
+    configs['catalogue_cache'] = os.path.join(workdir, 'cache')
+    ok = check_equivalence(configs, args)
+    print('ALL EQUIVALENT' if ok else 'MISMATCH')
+    sys.exit(0 if ok else 1)
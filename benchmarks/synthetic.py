@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os
+
+
+OPT_COLUMNS = ['id', 'description', 'owner', 'proposal_id', 'simulated_duration', 'product', 'state',
+               'lst_start', 'lst_start_end', 'avoid_sunrise_sunset', 'night_obs']
+STATES = ['SUBMITTED', 'SCHEDULED', 'COMPLETED', 'DRAFT', 'DECLINED']
+STATE_WEIGHTS = [0.55, 0.2, 0.05, 0.1, 0.1]
+GRADES = ['A', 'B1', 'B2']
+GRADE_WEIGHTS = [0.3, 0.4, 0.3]
+LST_CENTRES = [17.75, 3.5, 10.0] # hours: Galactic centre and two popular extragalactic fields
+LST_SPREAD = 1.5 # hours
+DUMMY = {'description': 'Idle', 'owner': 'none', 'proposal_id': 'none', 'product': 'none', 'Grade': 'Idle',
+         'avoid_sunrise_sunset': 'No', 'night_obs': 'No'}
+
+
+def lst_string(minutes):
+    minutes = int(minutes) % 1440
+    return '%02d:%02d' % (minutes // 60, minutes % 60)
+
+
+def lst_windows(rng, num_sbs, distribution = 'uniform', window_hours = (1, 12), centres = LST_CENTRES):
+    '''
+    This routine draws the LST windows of num_sbs SBs and returns their start and end (minutes).
+    The start is uniform over the sidereal day ('uniform') or drawn around the LST centres ('clustered',
+    with 30% of uniform background); the width is uniform in window_hours.
+    '''
+    assert distribution == 'uniform' or distribution == 'clustered', 'distribution has only two values: uniform or clustered [as string]'
+    if distribution == 'uniform':
+        start = rng.uniform(0, 24, num_sbs)
+    else:
+        centre = rng.choice(np.asarray(centres, dtype=float), num_sbs)
+        start = np.where(rng.random(num_sbs) < 0.3, rng.uniform(0, 24, num_sbs), rng.normal(centre, LST_SPREAD))
+    width = rng.uniform(window_hours[0], window_hours[1], num_sbs)
+    start = np.round(start * 60).astype(int) % 1440
+    end = (start + np.round(width * 60).astype(int)) % 1440
+    return start, end
+
+
+def generate_catalogue(directory, num_sbs = 500, seed = 1, distribution = 'uniform', window_hours = (1, 12),
+                       centres = LST_CENTRES, pulsar_fraction = 0.3, num_proposals = None, graded_fraction = 0.9):
+    '''
+    Usage:
+
+        paths = generate_catalogue(directory, num_sbs, seed) # then configs.update(paths)
+
+        Writes a synthetic catalogue in the formats read by Observation: the imaging and pulsar ObsList csv files
+        from OPT, the csv file of grades from the dashboard and the dummy (idle) record. The same seed gives the
+        same files. SBs have durations of 0.5 to 12 hours (multiples of 15 min), a mix of states (DRAFT and DECLINED
+        ones are dropped by the cleaning), and a fraction of them belongs to proposals without grade.
+        Returns the paths as the configs keys imaging, pulsar, dashboard and dummy.
+    '''
+    rng = np.random.default_rng(seed)
+    num_proposals = max(1, num_sbs // 10) if num_proposals is None else num_proposals
+    proposals = np.array(['SCI-%d' % i for i in range(num_proposals)])
+    start, end = lst_windows(rng, num_sbs, distribution, window_hours, centres)
+    data = pd.DataFrame({'id': 100000 + np.arange(num_sbs),
+                         'description': ['synthetic SB %d' % i for i in range(num_sbs)],
+                         'owner': ['owner%d' % i for i in rng.integers(0, 50, num_sbs)],
+                         'proposal_id': rng.choice(proposals, num_sbs),
+                         'simulated_duration': 900.0 * rng.integers(2, 49, num_sbs),
+                         'product': 'synthetic',
+                         'state': rng.choice(STATES, num_sbs, p=STATE_WEIGHTS),
+                         'lst_start': [lst_string(m) for m in start],
+                         'lst_start_end': [lst_string(m) for m in end],
+                         'avoid_sunrise_sunset': rng.choice(['Yes', 'No'], num_sbs, p=[0.4, 0.6]),
+                         'night_obs': rng.choice(['Yes', 'No'], num_sbs, p=[0.2, 0.8])})
+    pulsar = rng.random(num_sbs) < pulsar_fraction
+    graded = proposals[rng.random(num_proposals) < graded_fraction]
+    dashboard = pd.DataFrame({'Proposal Id': graded, 'Grade': rng.choice(GRADES, len(graded), p=GRADE_WEIGHTS)})
+    os.makedirs(directory, exist_ok=True)
+    paths = {'imaging': os.path.join(directory, 'imaging.csv'), 'pulsar': os.path.join(directory, 'pulsar.csv'),
+             'dashboard': os.path.join(directory, 'dashboard.csv'), 'dummy': os.path.join(directory, 'dummy.json')}
+    data[~pulsar][OPT_COLUMNS].to_csv(paths['imaging'], index=False)
+    data[pulsar][OPT_COLUMNS].to_csv(paths['pulsar'], index=False)
+    dashboard.to_csv(paths['dashboard'], index=False)
+    with open(paths['dummy'], 'w') as fp:
+        json.dump(DUMMY, fp, indent=4)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Synthetic OPT catalogue')
+    parser.add_argument('directory', type = str, help = 'output directory')
+    parser.add_argument('--num-sbs', type = int, default = 500, help = 'number of SBs')
+    parser.add_argument('--seed', type = int, default = 1, help = 'random seed')
+    parser.add_argument('--lst', type = str, default = 'uniform', help = 'distribution of the LST windows: uniform or clustered')
+    parser.add_argument('--window', type = float, nargs = 2, default = [1, 12], help = 'min and max width of the LST windows (hours)')
+    args = parser.parse_args()
+    print(json.dumps(generate_catalogue(args.directory, args.num_sbs, args.seed, args.lst, args.window), indent=4))
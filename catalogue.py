@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import hashlib
+import os
+import shutil
+import utils
+
+
+CATALOGUE_VERSION = 1 # bump when the cleaning below changes, to invalidate the compiled catalogues
+NUMERIC_COLUMNS = ['id', 'simulated_duration', 'lst_start_secs', 'lst_start_end_secs']
+STRING_COLUMNS = ['description', 'owner', 'proposal_id', 'product', 'state', 'lst_start', 'lst_start_end', 'avoid_sunrise_sunset', 'night_obs', 'Grade']
+
+
+def source_hash(filenames):
+    '''
+    This routine returns the hash of the content of the source files (csv from OPT and from the dashboard).
+    '''
+    digest = hashlib.sha256(str(CATALOGUE_VERSION).encode())
+    for filename in filenames:
+        with open(filename, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def catalogue_hash(configs):
+    '''
+    This routine returns the hash identifying the catalogue of a configuration (see source_hash).
+    '''
+    return source_hash([configs['imaging'], configs['pulsar'], configs['dashboard']])
+
+
+def compile_catalogue(imaging, pulsar, dashboard):
+    '''
+    This routine reads the csv files from OPT (imaging and pulsar SBs) and from the dashboard in katpaws, and returns the
+    cleaned table of SBs: no missing LST or duration, no DECLINED or DRAFT SB, LST in seconds and grade of the proposal.
+    '''
+    data = pd.concat([pd.read_csv(imaging), pd.read_csv(pulsar)], axis = 0).reset_index(drop=True)
+    data = data.dropna(subset=['lst_start', 'lst_start_end'])
+    data = data[(data['state'] != 'DECLINED') & (data['state'] != 'DRAFT')]
+    data = data.dropna(subset=['simulated_duration']).reset_index(drop=True)
+    data['lst_start_secs'] = utils.convert_strings_to_secs(data['lst_start'])
+    data['lst_start_end_secs'] = utils.convert_strings_to_secs(data['lst_start_end'])
+    dashboard = pd.read_csv(dashboard)
+    grade = data['proposal_id'].map(dict(zip(dashboard['Proposal Id'], dashboard['Grade'])))
+    data['Grade'] = grade.astype(object).where(grade.notna(), None) # proposals missing from the dashboard have no grade
+    return data[NUMERIC_COLUMNS + STRING_COLUMNS]
+
+
+def save_catalogue(data, path):
+    '''
+    This routine writes a compiled catalogue as one .npy file per column (strings as fixed-width unicode,
+    with a mask of the missing values), so that it is read back without any parsing.
+    '''
+    tmp_path = '%s.tmp%d' % (path, os.getpid())
+    os.makedirs(tmp_path, exist_ok=True)
+    for column in NUMERIC_COLUMNS:
+        np.save(os.path.join(tmp_path, '%s.npy' % column), data[column].to_numpy())
+    for column in STRING_COLUMNS:
+        missing = data[column].isna().to_numpy()
+        np.save(os.path.join(tmp_path, '%s.npy' % column), np.where(missing, '', data[column].astype(str).to_numpy()).astype(str))
+        np.save(os.path.join(tmp_path, '%s.missing.npy' % column), missing)
+    try:
+        os.rename(tmp_path, path)
+    except OSError: # compiled meanwhile by another process
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_compiled(path):
+    '''
+    This routine reads a compiled catalogue (see save_catalogue) into a table; the columns are copied into memory.
+    '''
+    columns = {}
+    for column in NUMERIC_COLUMNS:
+        columns[column] = np.load(os.path.join(path, '%s.npy' % column))
+    for column in STRING_COLUMNS:
+        values = np.load(os.path.join(path, '%s.npy' % column)).astype(object)
+        values[np.load(os.path.join(path, '%s.missing.npy' % column))] = None if column == 'Grade' else np.nan
+        columns[column] = values
+    return pd.DataFrame(columns)
+
+
+def load_catalogue(configs):
+    '''
+    Usage:
+
+        data, data_hash = load_catalogue(configs) # configs from config.yml
+
+        Returns the cleaned table of SBs (see compile_catalogue) and the hash of the source files (see catalogue_hash).
+        The first time a set of source files is seen, the table is compiled into configs['catalogue_cache'] under that
+        hash; later runs load the compiled columns (.npy) instead of parsing and cleaning the csv files again. An empty
+        catalogue_cache disables the cache.
+    '''
+    filenames = [configs['imaging'], configs['pulsar'], configs['dashboard']]
+    data_hash = catalogue_hash(configs)
+    cache_dir = configs.get('catalogue_cache')
+    if not cache_dir:
+        return compile_catalogue(*filenames), data_hash
+    path = os.path.join(cache_dir, 'catalogue-%s' % data_hash)
+    if not os.path.isdir(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        save_catalogue(compile_catalogue(*filenames), path)
+    return load_compiled(path), data_hash
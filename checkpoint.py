@@ -0,0 +1,146 @@
+import numpy as np
+from collections import OrderedDict
+from decision_cache import satisfies
+from engine import SimState
+
+
+class Checkpoint:
+    def __init__(self, parent, day, scheduled, counts, starts, rows, constraints):
+        '''
+        Node of the CheckpointTrie: state of the simulation after a run of picks (time cursor, packed
+        "already scheduled" mask, counters), the picks and idles recorded since the parent node, and the
+        comparisons (see DecisionTrace.constraints) that decided those picks.
+        '''
+        self.parent = parent
+        self.children = []
+        self.day = day
+        self.size = len(scheduled)
+        self.scheduled = np.packbits(scheduled)
+        self.counts = tuple(counts)
+        self.starts = starts
+        self.rows = rows
+        self.winner, self.beaten, self.strict = constraints
+
+    def path(self):
+        node, path = self, []
+        while node.parent is not None:
+            path.append(node)
+            node = node.parent
+        return path[::-1]
+
+
+class CheckpointTrie:
+    def __init__(self, class_grade, class_duration_norm, interval = 32, max_nodes = 4096):
+        '''
+        Usage:
+
+            trie = CheckpointTrie(class_grade, class_duration_norm, interval, max_nodes)
+            node = trie.resume(key, coeff, end) # deepest checkpoint consistent with coeff
+            state = trie.state(node, coeff, engine)
+            engine.simulate(..., trace = trace, state = state, on_pick = trie.recorder(node, trace, first_record).on_pick)
+
+            Snapshots of greedy simulations taken every interval picks, arranged in a trie keyed by the sequence of picks
+            (one root per key, e.g. the start time). Two coefficient vectors making the same first picks share the same
+            path, so a new simulation jumps to the deepest snapshot whose recorded decisions it reproduces and only
+            simulates the divergent suffix. The least recently used leaves are evicted beyond max_nodes.
+        '''
+        self.class_grade = class_grade
+        self.class_duration_norm = class_duration_norm
+        self.interval = interval
+        self.max_nodes = max_nodes
+        self.roots = {}
+        self.nodes = OrderedDict() # every non-root node, least recently used first
+        self.resumes = 0
+        self.picks_skipped = 0
+
+    def priorities(self, coeff):
+        return coeff[self.class_grade] * self.class_duration_norm
+
+    def consistent_child(self, node, priority, end):
+        for child in node.children:
+            if child.day <= end and satisfies(priority, child.winner, child.beaten, child.strict):
+                return child
+        return None
+
+    def resume(self, key, coeff, end):
+        '''
+        This routine returns the deepest checkpoint (root if none) whose picks would be made again with coeff
+        before end (UTC seconds).
+        '''
+        if key not in self.roots:
+            self.roots[key] = Checkpoint(None, None, np.zeros(0, dtype=bool), [], None, None, (None, None, None))
+        node = self.roots[key]
+        priority = self.priorities(coeff)
+        child = self.consistent_child(node, priority, end)
+        while child is not None:
+            node = child
+            self.nodes.move_to_end(node)
+            child = self.consistent_child(node, priority, end)
+        if node.parent is not None:
+            self.resumes += 1
+            self.picks_skipped += int(sum((n.rows >= 0).sum() for n in node.path()))
+        return node
+
+    def state(self, node, coeff, engine):
+        '''
+        This routine rebuilds the simulation state stored at a checkpoint (None for a root).
+        '''
+        if node.parent is None:
+            return None
+        path = node.path()
+        buffer = engine.make_buffer(np.concatenate([n.starts for n in path]), np.concatenate([n.rows for n in path]), coeff)
+        scheduled = np.unpackbits(node.scheduled, count=node.size).astype(bool)
+        return SimState(node.day, scheduled, list(node.counts), buffer)
+
+    def path_constraints(self, node):
+        '''
+        This routine returns the comparisons deciding all the picks from the root to a checkpoint.
+        '''
+        return [(n.winner, n.beaten, n.strict) for n in node.path()]
+
+    def recorder(self, node, trace, first_record):
+        return CheckpointRecorder(self, node, trace, first_record)
+
+    def add(self, node, checkpoint):
+        '''
+        This routine adds a checkpoint below a node, unless the node already has one for the same picks
+        (e.g. one beyond the end of an earlier, shorter simulation), and returns the checkpoint kept.
+        '''
+        for child in node.children:
+            if child.day == checkpoint.day and np.array_equal(child.rows, checkpoint.rows):
+                self.nodes.move_to_end(child)
+                return child
+        node.children.append(checkpoint)
+        self.nodes[checkpoint] = True
+        while len(self.nodes) > self.max_nodes:
+            old = next(n for n in self.nodes if len(n.children) == 0) # least recently used leaf
+            old.parent.children.remove(old)
+            del self.nodes[old]
+        return checkpoint
+
+    def stats(self):
+        return {'nodes': len(self.nodes), 'resumes': self.resumes, 'picks_skipped': self.picks_skipped}
+
+
+class CheckpointRecorder:
+    def __init__(self, trie, node, trace, first_record):
+        '''
+        Takes a checkpoint every trie.interval picks of a running simulation (see GreedyEngine.simulate, on_pick),
+        below the checkpoint the simulation resumed from. trace is the DecisionTrace of the simulation (it only
+        holds the picks made since node) and first_record the length of the schedule buffer at node.
+        '''
+        self.trie = trie
+        self.node = node
+        self.trace = trace
+        self.first_pick = 0
+        self.first_record = first_record
+
+    def on_pick(self, day, scheduled, counts, buffer):
+        if len(self.trace.winners) - self.first_pick < self.trie.interval:
+            return
+        constraints = self.trace.constraints(self.first_pick, len(self.trace.winners))
+        starts = buffer.start[self.first_record:buffer.length].copy()
+        rows = buffer.row[self.first_record:buffer.length].copy()
+        self.node = self.trie.add(self.node, Checkpoint(self.node, day, scheduled, counts, starts, rows, constraints))
+        self.first_pick = len(self.trace.winners)
+        self.first_record = buffer.length
@@ -0,0 +1,105 @@
+import numpy as np
+from collections import OrderedDict
+
+
+def satisfies(priority, winner, beaten, strict):
+    '''
+    This routine tells whether class priorities satisfy recorded comparisons (see DecisionTrace.constraints).
+    '''
+    p_winner, p_beaten = priority[winner], priority[beaten]
+    return bool(np.all(np.where(strict, p_winner > p_beaten, p_winner >= p_beaten)))
+
+
+class DecisionTrace:
+    def __init__(self, num_classes):
+        '''
+        Usage:
+
+            trace = DecisionTrace(num_classes)
+            trace.add(winner, earlier, later) # at every pick of the greedy loop
+
+            Records the comparisons that decided the picks of a greedy simulation. SBs are grouped in classes of equal
+            (grade, duration) since they always get the same priority. At each pick the winning class had to beat every
+            class of the candidates coming before it in pool order (strictly, ties go to the first SB) and to match or beat
+            the classes coming after it. Any sb_value satisfying all the recorded comparisons makes the same picks,
+            hence produces the same schedule and score.
+        '''
+        self.num_classes = num_classes
+        self.winners, self.best, self.classes, self.positions = [], [], [], []
+        self.included = [] # comparisons recorded elsewhere (e.g. along a checkpoint path)
+
+    def add(self, winner, best, classes, positions):
+        '''
+        This routine records a pick: class and pool position of the winner, classes and pool positions of all the candidates.
+        '''
+        self.winners.append(winner)
+        self.best.append(best)
+        self.classes.append(classes)
+        self.positions.append(positions)
+
+    def include(self, winner, beaten, strict):
+        self.included.append((winner, beaten, strict))
+
+    def constraints(self, first = 0, last = None):
+        '''
+        This routine returns the comparisons recorded for the picks first to last (all by default, together with the
+        included ones) as three arrays: winning class, beaten class, strict or not.
+        A comparison recorded both as strict and not is kept as strict.
+        '''
+        codes = [2 * (w * self.num_classes + b) + ~s for w, b, s in self.included] if first == 0 and last is None else []
+        last = len(self.winners) if last is None else last
+        if last > first:
+            lengths = [len(c) for c in self.classes[first:last]]
+            winner = np.repeat(self.winners[first:last], lengths)
+            weak = np.concatenate(self.positions[first:last]) > np.repeat(self.best[first:last], lengths)
+            codes.append(2 * (winner * self.num_classes + np.concatenate(self.classes[first:last])) + weak) # 2 * pair + (0 if strict else 1)
+        if len(codes) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+        codes = np.unique(np.concatenate(codes))
+        pairs, index = np.unique(codes // 2, return_index=True) # strict codes sort first
+        winner, beaten = pairs // self.num_classes, pairs % self.num_classes
+        keep = winner != beaten # SBs of the winning class coming later in pool order tie and lose
+        return winner[keep], beaten[keep], (codes[index] % 2 == 0)[keep]
+
+
+class DecisionCache:
+    def __init__(self, class_grade, class_duration_norm, max_entries = 256):
+        '''
+        Usage:
+
+            cache = DecisionCache(class_grade, class_duration_norm, max_entries)
+            result = cache.lookup(key, coeff) # None on a miss
+            cache.store(key, coeff, trace, result)
+
+            Cache of greedy simulations indexed by the decisions they made rather than by sb_value: a new coefficient
+            vector (priority per grade, see utils.assign_ranking) is a hit when it satisfies every comparison recorded
+            (see DecisionTrace) by an earlier simulation with the same key (horizon), e.g. a rescaled vector or one that
+            differs only where no pick was decided. The least recently used entries are evicted beyond max_entries.
+        '''
+        self.class_grade = class_grade
+        self.class_duration_norm = class_duration_norm
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key, coeff):
+        priority = coeff[self.class_grade] * self.class_duration_norm
+        for entry_key, (winner, beaten, strict, result) in reversed(self.entries.items()):
+            if entry_key[0] != key:
+                continue
+            if satisfies(priority, winner, beaten, strict):
+                self.entries.move_to_end(entry_key)
+                self.hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    def store(self, key, coeff, trace, result):
+        winner, beaten, strict = trace.constraints()
+        self.entries[(key, tuple(coeff))] = (winner, beaten, strict, result)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
@@ -0,0 +1,285 @@
+import numpy as np
+import pandas as pd
+import katpoint
+import datetime
+import utils
+from visibility import LSTIndex
+
+
+IDLE_ID = int(2e13)
+BUILD_TIME = 1800 # time (secs) needed to build the next SB, also the length of an idle slot
+EVENT_DELAY = 1 # tolerance (secs) on the time of an event (LST window opening, sunrise/sunset) when it falls on an idle slot
+IDLE_ADVANCES = ['fixed', 'event']
+# running counters of a simulation: idles, A/B1/B2-rank SBs, A-rank (B1-rank) SBs started before mid_time_opt_aproj (mid_time_opt_b1proj)
+COUNTERS = ['idle', 'A', 'B1', 'B2', 'A_early', 'B1_early']
+IDLE, A_EARLY, B1_EARLY = 0, 4, 5
+SCHEDULE_COLUMNS = ['Start time (UTC)', 'Start time (LST)','id','description','owner','proposal_id', 'duration', 'product', 'Grade', 'priority', 'avoid_sunrise_sunset', 'night_obs',
+                    'start_secs', 'duration_secs'] # numeric start (UTC seconds) and duration (secs) for the analytics (see utils)
+
+
+class ScheduleBuffer:
+    def __init__(self, size = 1024):
+        '''
+        Columnar record of a simulated schedule: start time (UTC seconds), picked row of the engine table
+        (-1 for idle) and priority. The arrays are preallocated and doubled when full.
+        '''
+        self.start = np.zeros(size)
+        self.row = np.zeros(size, dtype=np.int64)
+        self.priority = np.zeros(size)
+        self.length = 0
+
+    def append(self, day, row, priority):
+        if self.length == len(self.start):
+            for name in ['start', 'row', 'priority']:
+                column = getattr(self, name)
+                setattr(self, name, np.concatenate([column, np.zeros_like(column)]))
+        self.start[self.length] = day
+        self.row[self.length] = row
+        self.priority[self.length] = priority
+        self.length += 1
+
+
+def buffer_size(length):
+    return max(1024, 1 << int(length).bit_length())
+
+
+class Simulation:
+    def __init__(self, counts, buffer):
+        '''
+        Outcome of GreedyEngine.simulate: the score counters (see COUNTERS) and the buffer of picks.
+        '''
+        self.counts = dict(zip(COUNTERS, counts))
+        self.buffer = buffer
+
+
+class SimState:
+    def __init__(self, day, scheduled, counts, buffer):
+        '''
+        State of a greedy simulation between two steps: time cursor (UTC seconds), "already scheduled" mask,
+        counters (see COUNTERS) and buffer of the picks so far.
+        '''
+        self.day = day
+        self.scheduled = scheduled
+        self.counts = counts
+        self.buffer = buffer
+
+
+class Pool:
+    def __init__(self, engine, rows):
+        '''
+        A pool gathers the SBs that can be picked during daytime (day + avoid sunrise/sunset SBs)
+        or nighttime (night + avoid sunrise/sunset SBs). The rows are ordered the way
+        Observation.get_obs_at_time returns them (windows wrapping past 24h LST first), so that the
+        first maximum of the priorities is the SB picked by the pandas implementation.
+        '''
+        start, end = engine.lst_start[rows], engine.lst_end[rows]
+        self.rows = np.concatenate([rows[start > end], rows[start < end]])
+        self.start = engine.lst_start[self.rows]
+        self.end = engine.lst_end[self.rows]
+        self.wrap = self.start > self.end
+        self.duration = engine.duration[self.rows]
+        self.duration_norm = engine.duration_norm[self.rows]
+        self.grade = engine.grade[self.rows]
+        self.klass = engine.klass[self.rows]
+        # rows sharing an id are removed together once one of them is scheduled
+        self.same_id = {}
+        for i in self.rows:
+            self.same_id.setdefault(engine.id[i], []).append(i)
+        self.same_id = {k: np.array(v) for k, v in self.same_id.items()}
+        self.index = LSTIndex(self.start, self.end, self.duration)
+        # work buffers of the full scan, reused at every step
+        self.buffers = [np.zeros(len(self.rows), dtype=bool) for i in range(3)]
+
+    def candidates(self, lst, max_length, scheduled):
+        '''
+        This routine returns the positions (in the pool) of the SBs that can be run at a given LST (secs),
+        that are not scheduled yet and that last at most max_length seconds.
+        The positions come from the LST index (sorted by duration); an LST that is not a whole minute
+        falls back to a full scan of the pool.
+        '''
+        if self.index.covers(lst):
+            index = self.index.lookup(lst, max_length)
+            return index[~scheduled[self.rows[index]]]
+        a, b, c = self.buffers
+        np.less_equal(self.start, lst, out=a)
+        np.greater_equal(self.end, lst, out=b)
+        np.greater(self.end, lst, out=c)
+        np.logical_or(a, c, out=c) # windows wrapping past 24h LST
+        np.logical_and(a, b, out=b) # normal windows
+        np.copyto(b, c, where=self.wrap)
+        np.take(scheduled, self.rows, out=c)
+        np.logical_not(c, out=c)
+        np.logical_and(b, c, out=b)
+        np.less_equal(self.duration, max_length, out=a)
+        np.logical_and(b, a, out=b)
+        return np.flatnonzero(b)
+
+
+class GreedyEngine:
+    def __init__(self, obs):
+        '''
+        Usage:
+
+            engine = GreedyEngine(obs) # obs is an instance of Observation
+            result = engine.simulate(day, end, dict_priority)
+            df_obs = engine.build_schedule(result.buffer)
+
+            Array-backed version of the greedy branch of Observation.simulate_schedule. The catalogue is held
+            in contiguous NumPy columns with an "already scheduled" mask, and the priorities are computed in
+            one vectorized expression. The resulting schedule is identical to the one of the pandas implementation.
+            With idle_advance = 'event' (simulation section of config.yml) an idle telescope jumps to the first idle slot
+            at which an SB may become eligible instead of trying every slot of BUILD_TIME (see next_event): the schedule
+            is the same as with 'fixed', only the slots where nothing can change are skipped.
+        '''
+        self.obs = obs
+        self.idle_advance = obs.configs.get('simulation', {}).get('idle_advance', 'fixed')
+        assert self.idle_advance in IDLE_ADVANCES, 'idle_advance has only two values: fixed or event [as string]'
+        self.table = pd.concat([obs.data_day, obs.data_night, obs.data_avsrss], axis = 0).reset_index(drop=True)
+        self.id = self.table['id'].to_numpy()
+        self.duration = self.table['simulated_duration'].to_numpy(dtype=float)
+        self.duration_norm = self.duration / utils.NORMALIZE_TIME
+        self.lst_start = self.table['lst_start_secs'].to_numpy(dtype=np.int64)
+        self.lst_end = self.table['lst_start_end_secs'].to_numpy(dtype=np.int64)
+        unknown = set(self.table['Grade']) - set(utils.RANKING)
+        if len(unknown) > 0:
+            raise KeyError('unknown grade(s) %s, expected one of %s' % (sorted(map(str, unknown)), utils.RANKING))
+        self.grade = np.array([utils.RANKING.index(g) for g in self.table['Grade']], dtype=np.int64)
+        # classes of SBs sharing grade and duration, hence priority (see DecisionTrace)
+        classes = {}
+        self.klass = np.array([classes.setdefault(k, len(classes)) for k in zip(self.grade.tolist(), self.duration_norm.tolist())], dtype=np.int64)
+        self.class_grade = np.array([k[0] for k in classes], dtype=np.int64)
+        self.class_duration_norm = np.array([k[1] for k in classes], dtype=float)
+        n_day, n_night = len(obs.data_day), len(obs.data_night)
+        rows = np.arange(len(self.table))
+        self.pools = {'daytime': Pool(self, np.concatenate([rows[:n_day], rows[n_day + n_night:]])),
+                      'nighttime': Pool(self, np.concatenate([rows[n_day:n_day + n_night], rows[n_day + n_night:]]))}
+
+    def coefficients(self, dict_priority):
+        return np.array([dict_priority[g] for g in utils.RANKING], dtype=float)
+
+    def simulate(self, day, end, dict_priority, trace = None, state = None, on_pick = None, rng = None, sink = None):
+        '''
+        This routine runs the greedy selection from day to end (UTC seconds). The score counters are kept up to date
+        while the loop runs and the picks are recorded in a columnar buffer; the table is only built on request
+        (see build_schedule). The comparisons deciding each pick are recorded in trace (a DecisionTrace) if given.
+        The simulation resumes from state (a SimState, e.g. a checkpoint) if given, and on_pick(day, scheduled, counts, buffer)
+        is called after every pick. With rng (a numpy Generator) the selection is stochastic: the SB is drawn uniformly
+        among the candidates, in pool order as in the pandas implementation. sink.update(buffer) is called after every step
+        if sink is given (see export.ScheduleWriter).
+        '''
+        coeff = self.coefficients(dict_priority)
+        if state is None:
+            scheduled = np.zeros(len(self.table), dtype=bool)
+            buffer = ScheduleBuffer()
+            counts = [0] * len(COUNTERS)
+        else:
+            day, scheduled, counts, buffer = state.day, state.scheduled.copy(), list(state.counts), state.buffer
+        mid_time_a, mid_time_b1 = self.obs.mid_time_opt_aproj, self.obs.mid_time_opt_b1proj
+        idle_since = None # start of the current idle span (event idle advance)
+        while day <= end:
+            day_time, sunrise, sunset = self.obs.check_day_night(day)
+            pool = self.pools[day_time]
+            if day_time == 'daytime':
+                max_length = sunset - day - BUILD_TIME # buffer of 30 minutes
+            else:
+                max_length = sunrise - day - BUILD_TIME
+            index = pool.candidates(self.obs.ephemeris.lst_secs(day), max_length, scheduled)
+            if len(index) > 0:
+                if rng is None:
+                    priority = coeff[pool.grade[index]] * pool.duration_norm[index]
+                    top = priority.max()
+                    best = index[priority == top].min() # ties go to the first SB in pool order
+                else:
+                    best = np.sort(index)[rng.integers(len(index))]
+                    top = coeff[pool.grade[best]] * pool.duration_norm[best]
+                row = pool.rows[best]
+                if trace is not None:
+                    trace.add(pool.klass[best], best, pool.klass[index], index)
+                buffer.append(day, row, top)
+                grade = self.grade[row]
+                if grade < 3:
+                    counts[grade + 1] += 1
+                if grade == 0 and day <= mid_time_a:
+                    counts[A_EARLY] += 1
+                elif grade == 1 and day <= mid_time_b1:
+                    counts[B1_EARLY] += 1
+                day += (self.duration[row] + BUILD_TIME) # this is to include the next build
+                idle_since = None
+                scheduled[pool.same_id[self.id[row]]] = True
+                if on_pick is not None:
+                    on_pick(day, scheduled, counts, buffer)
+            elif self.idle_advance == 'event':
+                if idle_since is None:
+                    idle_since, idle_slots = day, 0 # first idle slot of the span and index of the current one
+                event = self.next_event(pool, day, max_length, scheduled)
+                # first slot of the BUILD_TIME grid of the idle span at or after the event, as 'fixed' would reach it
+                slots = max(idle_slots + 1, int(np.ceil((event - EVENT_DELAY - idle_since) / BUILD_TIME)))
+                day = idle_since + slots * BUILD_TIME
+                if day > end:
+                    slots = int((end - idle_since) // BUILD_TIME) + 1
+                for i in range(idle_slots, slots):
+                    buffer.append(idle_since + i * BUILD_TIME, -1, -1)
+                counts[IDLE] += slots - idle_slots
+                idle_slots = slots
+            else:
+                buffer.append(day, -1, -1)
+                counts[IDLE] += 1
+                day += BUILD_TIME
+            if sink is not None:
+                sink.update(buffer)
+        return Simulation(counts, buffer)
+
+    def next_event(self, pool, day, max_length, scheduled):
+        '''
+        This routine returns the next instant (UTC seconds) after day at which an SB of the pool may become eligible:
+        opening of the LST window of an SB not scheduled yet and not longer than max_length (or 0h LST for the windows
+        wrapping past 24h), sunrise or sunset, or LST at which the day/night state may switch (the duration limit only
+        grows with a change of day/night state). The caller snaps it to the grid of idle slots of BUILD_TIME.
+        '''
+        ephemeris = self.obs.ephemeris
+        openings = pool.start[~scheduled[pool.rows] & (pool.duration <= max_length)]
+        sun_time, sun_lst = ephemeris.next_sun_event(day)
+        lst_time = ephemeris.next_lst_time(day, np.concatenate([openings, sun_lst, [0]]))
+        return min(lst_time, sun_time)
+
+    def make_buffer(self, starts, rows, coeff):
+        '''
+        This routine returns a schedule buffer holding given picks, with their priorities computed from coeff.
+        '''
+        buffer = ScheduleBuffer(buffer_size(len(starts)))
+        buffer.length = len(starts)
+        buffer.start[:buffer.length] = starts
+        buffer.row[:buffer.length] = rows
+        picked = rows >= 0
+        buffer.priority[:buffer.length] = -1
+        buffer.priority[:buffer.length][picked] = coeff[self.grade[rows[picked]]] * self.duration_norm[rows[picked]]
+        return buffer
+
+    def reprioritize(self, result, coeff):
+        '''
+        This routine returns a copy of a simulation whose picks are kept but whose priorities are
+        recomputed with other coefficients (a hit of the DecisionCache).
+        '''
+        buffer = self.make_buffer(result.buffer.start[:result.buffer.length], result.buffer.row[:result.buffer.length], coeff)
+        return Simulation(list(result.counts.values()), buffer)
+
+    def build_schedule(self, buffer, first = 0, last = None):
+        '''
+        This routine turns the recorded picks into the schedule table of Observation.simulate_schedule,
+        or its rows first to last (excluded) only.
+        '''
+        last = buffer.length if last is None else last
+        dummy = self.obs.dummy
+        columns = [self.table[c].to_numpy() for c in ['id', 'description', 'owner', 'proposal_id', 'simulated_duration', 'product', 'Grade', 'avoid_sunrise_sunset', 'night_obs']]
+        records = []
+        for day, row, priority in zip(buffer.start[first:last], buffer.row[first:last], buffer.priority[first:last]):
+            lst_obs = str(self.obs.antenna.local_sidereal_time(katpoint.Timestamp(day)))
+            if row >= 0:
+                sb_id, description, owner, proposal_id, duration, product, grade, avsrss, night_obs = [c[row] for c in columns]
+                records.append([katpoint.Timestamp(day).to_string(), lst_obs, sb_id, description, owner, proposal_id,
+                                str(datetime.timedelta(seconds=duration)), product, grade, priority, avsrss, night_obs, day, duration])
+            else:
+                records.append([katpoint.Timestamp(day).to_string(), lst_obs, IDLE_ID, dummy['description'], dummy['owner'], dummy['proposal_id'],
+                                str(datetime.timedelta(seconds=BUILD_TIME)), dummy['product'], dummy['Grade'], -1,
+                                dummy['avoid_sunrise_sunset'], dummy['night_obs'], day, BUILD_TIME])
+        return pd.DataFrame(records, columns = SCHEDULE_COLUMNS, index = range(first, last))
@@ -0,0 +1,73 @@
+import numpy as np
+import parallel
+
+
+METRICS = ['idle', 'A', 'B1', 'B2']
+
+
+class EnsembleStats:
+    def __init__(self, quantiles = [0.05, 0.5, 0.95]):
+        '''
+        Usage:
+
+            stats = EnsembleStats(quantiles)
+            stats.add((idles, num_A, num_B1, num_B2)) # for every replica
+            stats.summary()
+
+            Streaming statistics of the counts of an ensemble of replicas: the counts are integers, so a histogram
+            per metric gives the mean and exact quantiles with a memory bounded by the number of distinct values.
+        '''
+        self.quantiles = quantiles
+        self.replicas = 0
+        self.histograms = {m: {} for m in METRICS}
+
+    def add(self, counts):
+        self.replicas += 1
+        for m, value in zip(METRICS, counts):
+            self.histograms[m][int(value)] = self.histograms[m].get(int(value), 0) + 1
+
+    def summary(self):
+        summary = {'replicas': self.replicas}
+        for m in METRICS:
+            values = np.array(sorted(self.histograms[m]))
+            weights = np.array([self.histograms[m][v] for v in values])
+            cumulative = np.cumsum(weights)
+            summary[m] = {'mean': float((values * weights).sum() / self.replicas)}
+            for q in self.quantiles:
+                summary[m]['q%g' % (100 * q)] = int(values[np.searchsorted(cumulative, q * self.replicas)])
+        return summary
+
+
+class Ensemble:
+    def __init__(self, configs, Obs, starttime, timespan, sb_value = [4,3,2,1]):
+        '''
+        Usage:
+
+            ensemble = Ensemble(configs['ensemble'], obs, start, timespan)
+            for stats in ensemble.run(replicas): # stats updated every configs['report_every'] replicas
+                print(stats.summary())
+
+            Seeded Monte Carlo ensemble of the stochastic selection: the replicas get independent seeds spawned from
+            configs['seed'] and run on configs['num_workers'] processes sharing the catalogue (see parallel.EvaluationPool).
+            Only the counts of each replica come back and they are aggregated on the fly (see EnsembleStats).
+        '''
+        self.obs = Obs
+        self.start_time = starttime
+        self.timespan = timespan
+        self.sb_value = sb_value
+        self.configs = configs
+
+    def run(self, replicas):
+        seeds = np.random.SeedSequence(self.configs['seed']).spawn(replicas) # full-entropy seeds, no collision at scale
+        tasks = [{'start': self.start_time, 'timespan': self.timespan, 'sb_value': self.sb_value, 'seed': seed} for seed in seeds]
+        stats = EnsembleStats(self.configs['quantiles'])
+        pool = parallel.EvaluationPool(self.obs, self.configs['num_workers']) if self.configs['num_workers'] > 1 else None
+        try:
+            results = pool.replicas(tasks) if pool is not None else (self.obs.replica_counts(**task) for task in tasks)
+            for counts in results:
+                stats.add(counts)
+                if stats.replicas % self.configs['report_every'] == 0 or stats.replicas == replicas:
+                    yield stats
+        finally:
+            if pool is not None:
+                pool.close()
@@ -0,0 +1,140 @@
+import numpy as np
+import katpoint
+import ephem
+import utils
+
+
+GRID_STEP = 3600 # spacing (secs) of the precomputed LST grid
+EVENT_MARGIN = 3600 * 24 * 2 # sunrise/sunset events are searched two days beyond the horizon
+LST_EDGE = 0.05 # LST (secs) closer than this to a minute boundary is computed exactly
+SECS_PER_RADIAN = 43200 / np.pi
+
+
+class EphemerisTimeline:
+    def __init__(self, antenna, start = None, end = None):
+        '''
+        Usage:
+
+            timeline = EphemerisTimeline(antenna, start, end) # start/end in UTC seconds since Unix epoch
+
+            The timeline holds, as arrays, the local sidereal time (LST) on a regular grid and the sunrise/sunset
+            events (with their LST) over the planning horizon. They are computed once and then reused by every
+            call to Observation.simulate_schedule, so that the greedy loop does not search the ephemeris at every step.
+            The horizon grows on demand when a time outside of it is queried.
+        '''
+        self.antenna = antenna
+        self.start = None
+        self.end = None
+        if start is not None and end is not None:
+            self.extend(start, end)
+
+    def extend(self, start, end):
+        '''
+        This routine makes sure that the interval [start, end] (UTC seconds) is covered by the timeline.
+        The arrays are (re)built over the union of the current and the requested horizon.
+        '''
+        if self.start is not None and start >= self.start and end <= self.end:
+            return
+        if self.start is not None:
+            start, end = min(start, self.start), max(end, self.end)
+        self.start = start - start % GRID_STEP
+        self.end = end + GRID_STEP - end % GRID_STEP
+        self.grid_secs = np.arange(self.start, self.end + GRID_STEP, GRID_STEP, dtype=float)
+        self.grid_lst = np.unwrap(self.antenna.local_sidereal_time(self.grid_secs).astype(float))
+        self.build_sun_events()
+
+    def build_sun_events(self):
+        '''
+        This routine lists all the sunrise and sunset events (UTC seconds) around the horizon,
+        together with their LST in seconds (as used by Observation.check_day_night).
+        '''
+        observer = self.antenna.observer
+        rise, sett = [], []
+        observer.date = katpoint.Timestamp(self.start - EVENT_MARGIN).to_ephem_date()
+        while True:
+            event = katpoint.Timestamp(observer.next_rising(ephem.Sun())).secs
+            rise.append(event)
+            observer.date = katpoint.Timestamp(event + 60).to_ephem_date()
+            if event > self.end + EVENT_MARGIN:
+                break
+        observer.date = katpoint.Timestamp(self.start - EVENT_MARGIN).to_ephem_date()
+        while True:
+            event = katpoint.Timestamp(observer.next_setting(ephem.Sun())).secs
+            sett.append(event)
+            observer.date = katpoint.Timestamp(event + 60).to_ephem_date()
+            if event > self.end + EVENT_MARGIN:
+                break
+        self.sunrise_secs = np.array(rise)
+        self.sunset_secs = np.array(sett)
+        self.sunrise_lst = np.array([self.exact_lst_secs(t) for t in rise])
+        self.sunset_lst = np.array([self.exact_lst_secs(t) for t in sett])
+
+    def exact_lst_secs(self, t):
+        '''
+        This routine returns the LST (minute resolution, in seconds) straight from katpoint.
+        '''
+        return utils.convert_string_to_secs(str(self.antenna.local_sidereal_time(katpoint.Timestamp(t))))
+
+    def lst_secs_array(self, times):
+        '''
+        This routine returns the LST (minute resolution, in seconds) for an array of UTC times.
+        The values are interpolated on the LST grid; the few times falling within LST_EDGE of
+        a minute boundary are recomputed with katpoint, so the result is identical to
+        convert_string_to_secs(str(antenna.local_sidereal_time(t))).
+        '''
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        if len(times) == 0:
+            return np.zeros(0, dtype=np.int64)
+        self.extend(times.min(), times.max())
+        lst = np.mod(np.interp(times, self.grid_secs, self.grid_lst), 2 * np.pi) * SECS_PER_RADIAN
+        frac = np.mod(lst, 60)
+        out = (lst - frac).astype(np.int64)
+        for i in np.flatnonzero((frac < LST_EDGE) | (frac > 60 - LST_EDGE)):
+            out[i] = self.exact_lst_secs(times[i])
+        return out
+
+    def lst_secs(self, t):
+        '''
+        Scalar version of lst_secs_array.
+        '''
+        return int(self.lst_secs_array([t])[0])
+
+    def next_lst_time(self, t, lst_values):
+        '''
+        This routine returns the first UTC time after t at which the LST reaches one of lst_values (secs),
+        by inverse interpolation of the unwrapped LST grid. Times beyond the horizon are clipped to its end.
+        '''
+        self.extend(t, t)
+        lst = np.interp(t, self.grid_secs, self.grid_lst)
+        ahead = np.mod(np.asarray(lst_values, dtype=float) / SECS_PER_RADIAN - lst, 2 * np.pi)
+        ahead = ahead[ahead > 0]
+        return float(np.interp(lst + (ahead.min() if len(ahead) > 0 else 2 * np.pi), self.grid_lst, self.grid_secs))
+
+    def next_sun_event(self, t):
+        '''
+        This routine returns the first sunrise or sunset (UTC seconds) after t, and the LSTs (secs) at which
+        day_night may switch until then (on either side of the minute of the sunrise and sunset it compares with).
+        '''
+        self.extend(t, t)
+        i_rise = np.searchsorted(self.sunrise_secs, t)
+        i_set = np.searchsorted(self.sunset_secs, t, side='right')
+        event = min(self.sunrise_secs[np.searchsorted(self.sunrise_secs, t, side='right')], self.sunset_secs[i_set])
+        lst = self.sunrise_lst[i_rise - 1], self.sunset_lst[i_set]
+        return event, [lst[0], lst[0] + 60, lst[1], lst[1] + 60]
+
+    def day_night(self, day):
+        '''
+        This routine returns the day/night state at a given time, together with the relevant sunrise and sunset
+        (UTC seconds). It reproduces Observation.check_day_night: during daytime (LST between the previous sunrise
+        and the next sunset) the previous sunrise and next sunset are returned, otherwise the next sunrise and the
+        previous sunset.
+        '''
+        self.extend(day, day)
+        i_rise = np.searchsorted(self.sunrise_secs, day)
+        i_set = np.searchsorted(self.sunset_secs, day, side='right')
+        day_lst_secs = self.lst_secs(day)
+        if day_lst_secs > self.sunrise_lst[i_rise - 1] and day_lst_secs < self.sunset_lst[i_set]:
+            return 'daytime', self.sunrise_secs[i_rise - 1], self.sunset_secs[i_set]
+        i_rise = np.searchsorted(self.sunrise_secs, day, side='right')
+        i_set = np.searchsorted(self.sunset_secs, day)
+        return 'nighttime', self.sunrise_secs[i_rise], self.sunset_secs[i_set - 1]
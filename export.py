@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import pandas as pd
+from engine import SCHEDULE_COLUMNS
+
+
+FORMATS = ['csv', 'parquet']
+ANALYTICS_COLUMNS = ['proposal_id', 'Grade', 'priority', 'start_secs', 'duration_secs'] # enough for utils.get_schedule_score and utils.get_utilisation
+
+
+def read_schedule(filename, columns = None):
+    '''
+    This routine reads a schedule written by ScheduleWriter, only the given columns if any.
+    '''
+    if filename.endswith('.parquet'):
+        return pd.read_parquet(filename, columns = columns)
+    return pd.read_csv(filename, index_col = None if columns is not None else 0, usecols = columns)
+
+
+class ScheduleWriter:
+    def __init__(self, filename, engine, chunk = 4096):
+        '''
+        Usage:
+
+            sink = ScheduleWriter('schedule/long_greedy_default.parquet', obs.engine)
+            obs.simulate_schedule(start, timespan, optim = False, sink = sink) # the table is not returned
+
+            Streaming export of a simulated schedule: the rows are written in chunks of chunk SBs while the simulation
+            runs, so only the columnar buffer of the picks is kept in memory, never the whole table. The format comes
+            from the extension of filename: csv (same layout as DataFrame.to_csv) or parquet (needs pyarrow).
+        '''
+        self.format = os.path.splitext(filename)[1].lstrip('.').lower()
+        assert self.format in FORMATS, 'the schedule file has only two formats: .csv or .parquet'
+        if self.format == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError('writing the schedule to parquet needs pyarrow (pip install pyarrow), or use a .csv file')
+            self.pyarrow = pyarrow
+            self.writer = None
+        self.filename = filename
+        self.engine = engine
+        self.chunk = chunk
+        self.written = 0
+        self.fp = open(filename, 'w', newline='') if self.format == 'csv' else None
+
+    def write(self, frame):
+        if len(frame) == 0:
+            return
+        if self.format == 'csv':
+            frame.to_csv(self.fp, header = self.written == 0)
+        else:
+            table = self.pyarrow.Table.from_pandas(self.normalize(frame), preserve_index = False)
+            if self.writer is None:
+                self.writer = self.pyarrow.parquet.ParquetWriter(self.filename, table.schema)
+            self.writer.write_table(table.cast(self.writer.schema))
+        self.written += len(frame)
+
+    def normalize(self, frame):
+        '''
+        This routine gives the chunks the same column types whatever their content (e.g. a chunk of idle SBs only).
+        '''
+        frame = frame.copy()
+        for column in frame.columns:
+            if column in ['id', 'priority', 'start_secs', 'duration_secs']:
+                frame[column] = frame[column].astype(np.int64 if column == 'id' else float)
+            else:
+                frame[column] = frame[column].map(lambda x: None if x is None or x != x else str(x))
+        return frame
+
+    def update(self, buffer):
+        '''
+        This routine writes the rows of buffer (an engine.ScheduleBuffer) not written yet, once there are chunk of them.
+        '''
+        if buffer.length - self.written >= self.chunk:
+            self.write(self.engine.build_schedule(buffer, self.written, buffer.length))
+
+    def close(self, buffer = None, frame = None):
+        '''
+        This routine writes the remaining rows of buffer, or the whole table frame (pandas implementation), and closes the file.
+        '''
+        if buffer is not None:
+            self.write(self.engine.build_schedule(buffer, self.written, buffer.length))
+        if frame is not None:
+            self.write(frame[SCHEDULE_COLUMNS])
+        if self.format == 'csv':
+            self.fp.close()
+        elif self.writer is not None:
+            self.writer.close()
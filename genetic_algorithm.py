@@ -1,14 +1,133 @@
 import numpy as np
 import random
-# np.random.seed(40) 
+# np.random.seed(40)
 from geneticalgorithm import geneticalgorithm as ga
+import parallel
 import sys
 import matplotlib
 matplotlib.use('Agg')
 
 
+class PopulationGA:
+    def __init__(self, function, dimension, variable_boundaries, algorithm_parameters, initial_population = None):
+        '''
+        Usage:
+
+            model = PopulationGA(function, dimension, variable_boundaries, algorithm_parameters, initial_population)
+            model.run()
+            model.best_variable, model.best_function
+
+            Elitist genetic algorithm for real variables, following the geneticalgorithm package (same parameters,
+            selection, crossover and mutation), except that function receives a whole population (2-D array, one
+            individual per row) and returns one score per individual, so that a generation is evaluated in one call.
+            The first individuals of the initial population can be given (e.g. elites of earlier runs), the others are random.
+        '''
+        self.f = function
+        self.dim = int(dimension)
+        self.var_bound = np.array(variable_boundaries, dtype=float)
+        self.param = algorithm_parameters
+        self.initial_population = initial_population
+        self.pop_s = int(self.param['population_size'])
+        self.par_s = int(self.param['parents_portion'] * self.pop_s)
+        if (self.pop_s - self.par_s) % 2 != 0:
+            self.par_s += 1
+        self.prob_mut = self.param['mutation_probability']
+        self.prob_cross = self.param['crossover_probability']
+        trl = self.pop_s * self.param['elit_ratio']
+        if trl < 1 and self.param['elit_ratio'] > 0:
+            self.num_elit = 1
+        else:
+            self.num_elit = int(trl)
+        assert self.par_s >= self.num_elit, 'number of parents must be greater than number of elits'
+        self.iterate = int(self.param['max_num_iteration'])
+        self.c_type = self.param['crossover_type']
+        assert self.c_type in ['uniform', 'one_point', 'two_point'], "crossover_type must be 'uniform', 'one_point', or 'two_point'"
+        if self.param['max_iteration_without_improv'] is None:
+            self.mniwi = self.iterate + 1
+        else:
+            self.mniwi = int(self.param['max_iteration_without_improv'])
+
+    def random_variables(self, size):
+        low, high = self.var_bound[:, 0], self.var_bound[:, 1]
+        return low + np.random.random((size, self.dim)) * (high - low)
+
+    def run(self):
+        pop = self.random_variables(self.pop_s)
+        if self.initial_population is not None:
+            seeds = np.clip(np.asarray(self.initial_population, dtype=float), self.var_bound[:, 0], self.var_bound[:, 1])[:self.pop_s]
+            pop[:len(seeds)] = seeds
+        obj = np.asarray(self.f(pop), dtype=float)
+        self.report = []
+        self.best_variable = pop[np.argmin(obj)].copy()
+        self.best_function = obj.min()
+        counter = 0
+        for t in range(1, self.iterate + 1):
+            order = obj.argsort()
+            pop, obj = pop[order], obj[order]
+            if obj[0] < self.best_function:
+                counter = 0
+                self.best_function = obj[0]
+                self.best_variable = pop[0].copy()
+            else:
+                counter += 1
+            self.report.append(obj[0])
+            # roulette wheel on the normalized objective
+            normobj = obj + abs(obj[0]) if obj[0] < 0 else obj.copy()
+            normobj = normobj.max() - normobj + 1
+            cumprob = np.cumsum(normobj / normobj.sum())
+            par = np.concatenate([np.arange(self.num_elit), [np.searchsorted(cumprob, np.random.random()) for k in range(self.num_elit, self.par_s)]]).astype(int)
+            ef_par = np.zeros(0, dtype=int)
+            while len(ef_par) == 0:
+                ef_par = par[np.random.random(self.par_s) <= self.prob_cross]
+            children = []
+            for k in range(self.par_s, self.pop_s, 2):
+                pvar1 = pop[ef_par[np.random.randint(0, len(ef_par))]]
+                pvar2 = pop[ef_par[np.random.randint(0, len(ef_par))]]
+                ch1, ch2 = self.cross(pvar1, pvar2)
+                children += [self.mut(ch1), self.mutmidle(ch2, pvar1, pvar2)]
+            children = np.array(children).reshape(-1, self.dim)
+            pop = np.concatenate([pop[par], children])
+            obj = np.concatenate([obj[par], np.asarray(self.f(children), dtype=float)])
+            if counter > self.mniwi:
+                break
+        order = obj.argsort()
+        if obj[order[0]] < self.best_function:
+            self.best_function = obj[order[0]]
+            self.best_variable = pop[order[0]].copy()
+        self.report.append(obj[order[0]])
+        self.output_dict = {'variable': self.best_variable, 'function': self.best_function}
+        sys.stdout.write('\r The best solution found:\n %s' % (self.best_variable))
+        sys.stdout.write('\n\n Objective function:\n %s\n' % (self.best_function))
+        sys.stdout.flush()
+
+    def cross(self, x, y):
+        ofs1, ofs2 = x.copy(), y.copy()
+        if self.c_type == 'one_point':
+            swap = np.arange(self.dim) < np.random.randint(0, self.dim)
+        elif self.c_type == 'two_point':
+            ran1 = np.random.randint(0, self.dim)
+            ran2 = np.random.randint(ran1, self.dim)
+            swap = (np.arange(self.dim) >= ran1) & (np.arange(self.dim) < ran2)
+        else:
+            swap = np.random.random(self.dim) < 0.5
+        ofs1[swap], ofs2[swap] = y[swap], x[swap]
+        return ofs1, ofs2
+
+    def mut(self, x):
+        mutate = np.random.random(self.dim) < self.prob_mut
+        x[mutate] = self.random_variables(1)[0][mutate]
+        return x
+
+    def mutmidle(self, x, p1, p2):
+        mutate = np.random.random(self.dim) < self.prob_mut
+        low, high = np.minimum(p1, p2), np.maximum(p1, p2)
+        between = low + np.random.random(self.dim) * (high - low)
+        x[mutate] = np.where(low < high, between, self.random_variables(1)[0])[mutate]
+        return x
+
+
 class GeneticAlgo:
-    def __init__(self, configs, Obs, starttime, timespan, selection, plan):
+    def __init__(self, configs, Obs, starttime, timespan, selection, plan, trace = None, history = None, warm_start = 0, warm_budget = 1.0):
         super(GeneticAlgo, self).__init__()
         self.obs = Obs
         self.start_time = starttime
@@ -17,8 +136,10 @@ class GeneticAlgo:
         self.plan = plan
         self.num_dimension = 4
         self.configs = configs
+        self.trace = trace # profiling.EvaluationTrace receiving every evaluation, if given
+        self.history = history # history.HistoryStore recording every evaluation, if given
         self.varbound = np.array([self.configs['varabound']] * self.num_dimension)
-        self.algorithm_param = {'max_num_iteration': self.configs['params']['max_num_iteration'], 
+        self.algorithm_param = {'max_num_iteration': self.configs['params']['max_num_iteration'],
                    'population_size': self.configs['params']['population_size'],
                    'mutation_probability': self.configs['params']['mutation_probability'],
                    'elit_ratio': self.configs['params']['elit_ratio'],
@@ -26,18 +147,62 @@ class GeneticAlgo:
                    'parents_portion': self.configs['params']['parents_portion'],
                    'crossover_type': self.configs['params']['crossover_type'],
                    'max_iteration_without_improv': None}
-        self.model = ga(function = self.cost_function,
-                        dimension = self.num_dimension,
-                        variable_type = 'real',
-                        variable_boundaries = self.varbound,
-                        algorithm_parameters = self.algorithm_param,
-                        function_timeout = 60)
+        self.fitness = {} # scores of the individuals already evaluated
+        self.pool = None
+        initial_population = None
+        if self.history is not None and warm_start > 0 and self.configs['mode'] != 'population':
+            print('warm start ignored: the initial population can only be given in population mode')
+        elif self.history is not None and warm_start > 0 and self.history.has_runs(self.plan, self.timespan, self.selection):
+            # known scores (same catalogue and start) are reused, the elites of earlier runs join the initial population,
+            # and they replace most of the exploration of a cold start (warm_budget of the generations)
+            X_known, Y_known, X_new = self.history.warm_start(self.start_time, self.plan, self.timespan, self.selection,
+                                                              min(warm_start, self.algorithm_param['population_size']), self.varbound)
+            self.fitness.update(zip([tuple(x) for x in X_known], Y_known[:, 0]))
+            initial_population = np.concatenate([X_known, X_new])
+            self.algorithm_param['max_num_iteration'] = max(1, int(round(self.algorithm_param['max_num_iteration'] * warm_budget)))
+        if self.configs['mode'] == 'population':
+            # a whole generation is evaluated at once, on num_workers processes, skipping known individuals
+            if self.configs['num_workers'] > 1:
+                self.pool = parallel.EvaluationPool(self.obs, self.configs['num_workers'])
+            self.model = PopulationGA(function = self.evaluate_population,
+                                      dimension = self.num_dimension,
+                                      variable_boundaries = self.varbound,
+                                      algorithm_parameters = self.algorithm_param,
+                                      initial_population = initial_population)
+        else:
+            self.model = ga(function = self.cost_function,
+                            dimension = self.num_dimension,
+                            variable_type = 'real',
+                            variable_boundaries = self.varbound,
+                            algorithm_parameters = self.algorithm_param,
+                            function_timeout = self.configs['function_timeout'])
 
     def cost_function(self, x):
-        score = self.obs.simulate_schedule(start = self.start_time, timespan = self.timespan,
-                                          method = self.selection,
-                                          sb_value = x, plan = self.plan)
+        task = {'start': self.start_time, 'timespan': self.timespan, 'method': self.selection, 'sb_value': x, 'plan': self.plan}
+        score = parallel.evaluate_tasks(self.obs, None, [task], self.trace, self.history)[0]
         return score
-    
+
+    def evaluate_population(self, X):
+        '''
+        This routine returns the scores of a population (one individual per row). Individuals already
+        scored (e.g. elites, duplicates) are read from the fitness cache, the others are simulated
+        (in parallel when a pool of workers is available).
+        '''
+        keys = [tuple(x) for x in X]
+        missing = list(dict.fromkeys(k for k in keys if k not in self.fitness))
+        if self.trace is not None:
+            for k in keys:
+                if k in self.fitness:
+                    self.trace.write(k, self.fitness[k], 0.0, {'cache': 'fitness', 'resumed_picks': 0, 'timespan': self.timespan})
+        tasks = [{'start': self.start_time, 'timespan': self.timespan, 'method': self.selection,
+                  'sb_value': list(k), 'plan': self.plan} for k in missing]
+        scores = parallel.evaluate_tasks(self.obs, self.pool, tasks, self.trace, self.history)
+        self.fitness.update(zip(missing, scores))
+        return np.array([self.fitness[k] for k in keys])
+
     def optimize(self):
-        self.model.run()
\ No newline at end of file
+        try:
+            self.model.run()
+        finally:
+            if self.pool is not None:
+                self.pool.close()
@@ -0,0 +1,119 @@
+import numpy as np
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+NUM_PARAMS = 4 # sb_value: coefficients of the A, B1, B2 and ungraded SBs
+
+
+def param_seeds(directory = 'params'):
+    '''
+    This routine returns the coefficients saved by main.py (params/*.json) as an array, one row per file.
+    '''
+    seeds = []
+    for filename in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(filename) as json_file:
+            params_dict = json.load(json_file)
+        seeds.append([params_dict['coeff_a'], params_dict['coeff_b1'], params_dict['coeff_b2'], params_dict['coeff_none']])
+    return np.array(seeds, dtype=float).reshape(-1, NUM_PARAMS)
+
+
+class HistoryStore:
+    def __init__(self, filename, catalogue):
+        '''
+        Usage:
+
+            store = HistoryStore('history.sqlite', obs.catalogue_hash)
+            store.add(tasks, scores) # simulate_schedule tasks (keyword arguments) and their scores
+            X, Y = store.evaluations(start, plan, timespan, selection)
+            X = store.elites(plan, timespan, selection, num)
+
+            Local sqlite store of the evaluations of the optimizers: parameters (sb_value), score, catalogue hash,
+            start time, plan, horizon and selection method. Evaluations of the same catalogue, start and horizon are
+            reused as they are; the best parameters found for other starts or catalogues are worth re-evaluating.
+            The evaluations can be added from other threads (the geneticalgorithm package runs the cost function
+            in a timeout thread), one at a time.
+        '''
+        self.catalogue = catalogue
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread = False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS evaluations (catalogue TEXT, start TEXT, plan TEXT, timespan REAL, selection TEXT, '
+                        'x0 REAL, x1 REAL, x2 REAL, x3 REAL, score REAL, created REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS evaluations_context ON evaluations (plan, timespan, selection, catalogue, start)')
+        self.db.commit()
+
+    def add(self, tasks, scores):
+        now = time.time()
+        with self.lock:
+            self.db.executemany('INSERT INTO evaluations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                [(self.catalogue, task['start'], task['plan'], float(task['timespan']), task['method'])
+                                 + tuple(float(x) for x in task['sb_value']) + (float(score), now) for task, score in zip(tasks, scores)])
+            self.db.commit()
+
+    def has_runs(self, plan, timespan, selection):
+        '''
+        This routine tells whether evaluations of the same plan, horizon and selection were stored (any catalogue and start).
+        '''
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM evaluations WHERE plan = ? AND timespan = ? AND selection = ? LIMIT 1',
+                                   (plan, float(timespan), selection)).fetchone() is not None
+
+    def evaluations(self, start, plan, timespan, selection, limit = None):
+        '''
+        This routine returns the parameters and scores (best first, at most limit) evaluated with the current
+        catalogue for the same start, plan, horizon and selection.
+        '''
+        with self.lock:
+            rows = self.db.execute('SELECT x0, x1, x2, x3, MIN(score) FROM evaluations WHERE catalogue = ? AND start = ? AND plan = ? '
+                                   'AND timespan = ? AND selection = ? GROUP BY x0, x1, x2, x3 ORDER BY MIN(score) LIMIT ?',
+                                   (self.catalogue, start, plan, float(timespan), selection, -1 if limit is None else limit)).fetchall()
+        rows = np.array(rows, dtype=float).reshape(-1, NUM_PARAMS + 1)
+        return rows[:, :NUM_PARAMS], rows[:, NUM_PARAMS:]
+
+    def elites(self, plan, timespan, selection, num, skip_start = None):
+        '''
+        This routine returns up to num distinct parameters among the best of each earlier run (catalogue and start)
+        of the same plan, horizon and selection, taking the first of every run, then the second, and so on,
+        most recent runs first. The run of the current catalogue from skip_start is left out.
+        '''
+        with self.lock:
+            rows = self.db.execute('SELECT catalogue, start, x0, x1, x2, x3, score, created FROM evaluations WHERE plan = ? '
+                                   'AND timespan = ? AND selection = ?', (plan, float(timespan), selection)).fetchall()
+        runs = {}
+        for catalogue, start, x0, x1, x2, x3, score, created in rows:
+            if catalogue == self.catalogue and start == skip_start:
+                continue
+            run = runs.setdefault((catalogue, start), {'created': 0, 'points': []})
+            run['created'] = max(run['created'], created)
+            run['points'].append((score, (x0, x1, x2, x3)))
+        runs = sorted(runs.values(), key = lambda run: -run['created'])
+        ranked = [[x for score, x in sorted(run['points'])] for run in runs]
+        seen = set()
+        elites = []
+        for rank in range(max([len(r) for r in ranked] + [0])):
+            for points in ranked:
+                if rank < len(points) and points[rank] not in seen and len(elites) < num:
+                    seen.add(points[rank])
+                    elites.append(points[rank])
+        return np.array(elites, dtype=float).reshape(-1, NUM_PARAMS)
+
+    def warm_start(self, start, plan, timespan, selection, num, varbound):
+        '''
+        This routine returns the prior knowledge for a new optimization: the known parameters and scores
+        (same catalogue, start and horizon, at most num) and up to num other parameters to re-evaluate
+        (params/*.json, then elites of earlier runs), within varbound (one [low, high] row per parameter).
+        '''
+        X_known, Y_known = self.evaluations(start, plan, timespan, selection, limit = num)
+        X_new = np.concatenate([param_seeds(), self.elites(plan, timespan, selection, num, skip_start = start)])
+        varbound = np.asarray(varbound, dtype=float)
+        X_new = np.clip(X_new, varbound[:, 0], varbound[:, 1])
+        known = set(tuple(x) for x in X_known.tolist())
+        X_new = np.array([x for x in dict.fromkeys(tuple(x) for x in X_new.tolist()) if x not in known], dtype=float).reshape(-1, NUM_PARAMS)
+        return X_known, Y_known, X_new[:num]
+
+    def close(self):
+        self.db.close()
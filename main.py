@@ -1,20 +1,20 @@
 import numpy as np
 import observation as Obs
+import profiling
+import utils
+import os
 import argparse
-import bayesian_optimization as bo
-import genetic_algorithm as ga
 import yaml
 import json
 import time
 import sys
-import katpoint
 from tabulate import tabulate
 from datetime import datetime
 import ast
 
 
-def fit_function(obs, x, args, configs, optim = False):
-    score = obs.simulate_schedule(start = args.start, timespan = configs['plan'][args.plan], method = args.selection, sb_value = [x[0], x[1], x[2], x[3]], optim = optim)
+def fit_function(obs, x, args, configs, optim = False, sink = None):
+    score = obs.simulate_schedule(start = args.start, timespan = configs['plan'][args.plan], method = args.selection, sb_value = [x[0], x[1], x[2], x[3]], optim = optim, sink = sink)
     return score
 
 def params_dictionary(params):
@@ -31,11 +31,36 @@ def printing_output(score_baseline, score_optimized, algo):
                     )
     print(table)
 
+def printing_ensemble(summary):
+    quantiles = [k for k in summary['idle'] if k != 'mean']
+    data = [[metric, summary[metric]['mean']] + [summary[metric][q] for q in quantiles] for metric in ['idle', 'A', 'B1', 'B2']]
+    table = tabulate(
+                        data,
+                        headers=["Count (%d replicas)" % summary['replicas'], "mean"] + quantiles,
+                        tablefmt="grid"
+                    )
+    print(table)
+
+def printing_utilisation(table):
+    score, usage = utils.get_schedule_score(table)
+    print('schedule score: %.4f, telescope usage: %.2f%%' % (score, usage))
+    utilisation = utils.get_utilisation(table, by = 'Grade')
+    data = [[grade, int(row['sbs']), row['observed_secs'] / 3600, 100 * row['fraction']] for grade, row in utilisation.iterrows()]
+    table = tabulate(
+                        data,
+                        headers=["Grade", "# SBs", "observed (h)", "share (%)"],
+                        tablefmt="grid", floatfmt=".2f"
+                    )
+    print(table)
+
 def assert_arguments(args):
     assert args.plan == 'long' or args.plan == 'short', 'plan has only two values: long or short [as string]'
-    assert args.algo == 'bo' or args.algo == 'ga', 'algo has only two values: bo or ga [as string]'
+    assert args.algo == 'bo' or args.algo == 'ga' or args.algo == 'mf', 'algo has only three values: bo, ga or mf [as string]'
     assert args.optim == 'True' or args.optim == 'False', 'optim has only two values: True or False [as string]'
     assert args.save == 'True' or args.save == 'False', 'save has only two values: True or False [as string]'
+    assert args.profile == 'True' or args.profile == 'False', 'profile has only two values: True or False [as string]'
+    assert args.warm == 'True' or args.warm == 'False', 'warm has only two values: True or False [as string]'
+    assert args.sched_format == 'csv' or args.sched_format == 'parquet', 'sched_format has only two values: csv or parquet [as string]'
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Scheduling Optimization')
@@ -46,6 +71,11 @@ if __name__ == "__main__":
     parser.add_argument('--optim', type = str, default = 'True', help = 'specify whether to optimize or test existing params')
     parser.add_argument('--save', type = str, default = 'False', help = 'specify whether to save the optimized params')
     parser.add_argument('--sched', type = str, default = 'False', help = 'specify whether to save the resulting scheduling plan')
+    parser.add_argument('--sched_format', type = str, default = 'csv', help = 'specify the format of the saved scheduling plan: csv or parquet')
+    parser.add_argument('--profile', type = str, default = 'False', help = 'specify whether to report the time spent per phase of the simulations')
+    parser.add_argument('--warm', type = str, default = 'False', help = 'specify whether to warm-start the optimization from the history (e.g. daily re-planning from a new start)')
+    parser.add_argument('--replicas', type = int, default = 0, help = 'number of replicas of the stochastic selection to aggregate (no optimization)')
+    parser.add_argument('--trace', type = str, default = '', help = 'jsonl file receiving every evaluation of the optimization (none by default)')
     args = parser.parse_args()
     assert_arguments(args)
     # print(ast.literal_eval(args.sched))
@@ -54,30 +84,69 @@ if __name__ == "__main__":
     print('*' * 20)
     configs = yaml.safe_load(open('config.yml'))
     obs = Obs.Observation(configs, args)
+    if args.profile == 'True':
+        obs.profiler = profiling.attach(obs)
+    trace = profiling.EvaluationTrace(args.trace, args.algo) if args.trace else None
+    store = None
+    if configs.get('history', {}).get('file'):
+        import history
+        store = history.HistoryStore(configs['history']['file'], obs.catalogue_hash)
+    warm_start, warm_budget = 0, 1.0
+    if args.warm == 'True' and store is not None:
+        # the optimizers cut their budget to warm_budget only when prior evaluations are found for this plan
+        warm_start, warm_budget = configs['history']['warm_points'], configs['history']['warm_budget']
+    if args.replicas > 0:
+        import ensemble
+        print('running %d replicas of the stochastic selection ...' % args.replicas)
+        for stats in ensemble.Ensemble(configs['ensemble'], obs, args.start, configs['plan'][args.plan]).run(args.replicas):
+            summary = stats.summary()
+            print('%d replicas: mean idle %.1f, A %.1f, B1 %.1f, B2 %.1f' % (summary['replicas'], summary['idle']['mean'], summary['A']['mean'], summary['B1']['mean'], summary['B2']['mean']))
+        printing_ensemble(summary)
+        sys.exit(0)
+    sink = None
+    if args.sched == 'True':
+        import export
+        # the scheduling plan is written while it is simulated instead of being kept as a table
+        os.makedirs('schedule', exist_ok = True)
+        sched_file = 'schedule/%s_%s_%s.%s' % (str(datetime.now()).split('.')[0].replace(" ", "_"), args.algo, args.plan, args.sched_format)
+        sink = export.ScheduleWriter(sched_file, obs.engine)
     print('estimating the baseline ...')
     baseline = fit_function(obs, [4, 3, 2, 1], args, configs, optim = False)
     if args.optim == 'True':
         if args.algo == 'bo':
+            import bayesian_optimization as bo # the optimizer backends are only imported when used
             start_time_it = time.time()
             print('building the bayesian model for optimization ...')
-            bayesopt = bo.BayesOpt(configs['bayesopt'], obs, args.start, configs['plan'][args.plan], args.selection, args.plan)
+            bayesopt = bo.BayesOpt(configs['bayesopt'], obs, args.start, configs['plan'][args.plan], args.selection, args.plan, trace = trace, history = store, warm_start = warm_start, warm_budget = warm_budget)
             print('optimization begins ...')
             bayesopt.optimize()
             params = bayesopt.build_opt.x_opt
             print('optimization takes about %4.2f min' % ((time.time() - start_time_it) / 60))
-            score = fit_function(obs, params, args, configs, optim = False)
+            score = fit_function(obs, params, args, configs, optim = False, sink = sink)
             printing_output(baseline, score[:-1], args.algo)
         elif args.algo == 'ga':
+            import genetic_algorithm as ga
             start_time_it = time.time()
             print('building the genetic algorithm model for optimization ...')
-            geneticalgo = ga.GeneticAlgo(configs['geneticalgo'], obs, args.start, configs['plan'][args.plan], args.selection, args.plan)
+            geneticalgo = ga.GeneticAlgo(configs['geneticalgo'], obs, args.start, configs['plan'][args.plan], args.selection, args.plan, trace = trace, history = store, warm_start = warm_start, warm_budget = warm_budget)
             print('optimization begins ...')
             geneticalgo.optimize()
             print('optimization takes about %4.2f min' % ((time.time() - start_time_it) / 60))
             params = geneticalgo.model.best_variable
-            score = fit_function(obs, params, args, configs, optim = False)
+            score = fit_function(obs, params, args, configs, optim = False, sink = sink)
             printing_output(baseline, score[:-1], args.algo)
             # print(score[4])
+        elif args.algo == 'mf':
+            import multi_fidelity as mf
+            start_time_it = time.time()
+            print('building the multi-fidelity model for optimization ...')
+            multifidelity = mf.MultiFidelity(configs['multifidelity'], obs, args.start, configs['plan'][args.plan], args.selection, args.plan, trace = trace, history = store)
+            print('optimization begins ...')
+            multifidelity.optimize()
+            print('optimization takes about %4.2f min' % ((time.time() - start_time_it) / 60))
+            params = multifidelity.best_variable
+            score = fit_function(obs, params, args, configs, optim = False, sink = sink)
+            printing_output(baseline, score[:-1], args.algo)
         if args.save == 'True':
             dict_params = params_dictionary(params)
             with open('params/%s_%s_params.json' % (args.algo, args.plan), 'w') as fp:
@@ -87,7 +156,14 @@ if __name__ == "__main__":
         with open('params/%s_%s_params.json' % (args.algo, args.plan)) as json_file:
             params_dict = json.load(json_file)
         params = [params_dict['coeff_a'], params_dict['coeff_b1'], params_dict['coeff_b2'], params_dict['coeff_none']]
-        score = fit_function(obs, params, args, configs, optim = False)
+        score = fit_function(obs, params, args, configs, optim = False, sink = sink)
         printing_output(baseline, score[:-1], args.algo)
+    if trace is not None:
+        trace.close()
+    if store is not None:
+        store.close()
+    if obs.profiler is not None:
+        print(obs.profiler.summary())
     if args.sched == 'True':
-        score[4].to_csv('schedule/%s_%s_%s.csv' % (str(datetime.now()).split('.')[0].replace(" ", "_"), args.algo, args.plan))
+        print('scheduling plan saved to %s' % sched_file)
+        printing_utilisation(export.read_schedule(sched_file, columns = export.ANALYTICS_COLUMNS))
@@ -0,0 +1,64 @@
+import numpy as np
+import parallel
+import sys
+
+
+class MultiFidelity:
+    def __init__(self, configs, Obs, starttime, timespan, selection, plan, trace = None, history = None):
+        '''
+        Usage:
+
+            mf = MultiFidelity(configs['multifidelity'], obs, start, timespan, selection, plan)
+            mf.optimize()
+            mf.best_variable, mf.best_function
+
+            Successive halving over random sb_value candidates: all the candidates are scored on the shortest horizon
+            of configs['rungs'] (hours, e.g. the 54-day window of mid_time_opt_aproj), the best 1/eta of them are promoted
+            to the next horizon, and so on until the full timespan, on which only the last survivors are scored. The
+            truncated simulations share their first picks with the longer ones, so the checkpoints of Observation let
+            the promoted candidates resume from them; with num_workers > 1 every candidate is always evaluated by the
+            same worker (see parallel.AffinityPool), which holds the checkpoints of its earlier rungs.
+        '''
+        self.obs = Obs
+        self.start_time = starttime
+        self.timespan = timespan
+        self.selection = selection
+        self.plan = plan
+        self.configs = configs
+        self.trace = trace # profiling.EvaluationTrace receiving every evaluation, if given
+        self.history = history # history.HistoryStore recording every evaluation, if given
+        self.num_dimension = 4
+        self.varbound = np.array([self.configs['varabound']] * self.num_dimension, dtype=float)
+        self.rungs = [r for r in sorted(self.configs['rungs']) if r < self.timespan] + [self.timespan]
+        self.rng = np.random.default_rng(self.configs['seed'])
+        self.pool = parallel.AffinityPool(self.obs, self.configs['num_workers']) if self.configs['num_workers'] > 1 else None
+
+    def cost_function(self, X, timespan):
+        tasks = [{'start': self.start_time, 'timespan': timespan, 'method': self.selection,
+                  'sb_value': list(x), 'plan': self.plan} for x in X]
+        return np.array(parallel.evaluate_tasks(self.obs, self.pool, tasks, self.trace, self.history))
+
+    def optimize(self):
+        try:
+            low, high = self.varbound[:, 0], self.varbound[:, 1]
+            X = low + self.rng.random((int(self.configs['candidates']), self.num_dimension)) * (high - low)
+            self.report = []
+            for rung, timespan in enumerate(self.rungs):
+                scores = self.cost_function(X, timespan)
+                self.report.append({'timespan': timespan, 'evaluations': len(X), 'best': float(scores.min())})
+                order = np.argsort(scores, kind='stable')
+                if rung < len(self.rungs) - 1:
+                    X = X[order[:max(1, len(X) // self.configs['eta'])]]
+            self.best_variable = X[order[0]]
+            self.best_function = scores[order[0]]
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+        full = self.report[-1]['evaluations']
+        simulated = sum(r['timespan'] * r['evaluations'] for r in self.report)
+        self.saved = int(self.configs['candidates']) - full
+        sys.stdout.write('\r The best solution found:\n %s' % (self.best_variable))
+        sys.stdout.write('\n\n Objective function:\n %s\n' % (self.best_function))
+        sys.stdout.write('\n full-length evaluations: %d out of %d candidates (%d saved), simulated horizon: %.0f%% of the full-length runs\n'
+                         % (full, int(self.configs['candidates']), self.saved, 100.0 * simulated / (self.timespan * int(self.configs['candidates']))))
+        sys.stdout.flush()
@@ -4,14 +4,15 @@ import katpoint
 import time
 import warnings
 warnings.filterwarnings('ignore')
-import random
 import datetime
-from tqdm import tqdm
-import sys
 import json
-import ephem
 np.random.seed(40)
 import utils
+import catalogue
+from ephemeris import EphemerisTimeline
+from engine import GreedyEngine, SCHEDULE_COLUMNS
+from decision_cache import DecisionCache, DecisionTrace
+from checkpoint import CheckpointTrie
 
 
 MAX_NUM_IDLES = 900
@@ -27,35 +28,37 @@ class Observation:
             The "obs" is an instance of class Observation, and it will be used by the optimization algorithm(s).  
         '''
         self.configs = configs
-        self.mid_time_opt_aproj  = katpoint.Timestamp(args.start).secs + 3600 * 24 * 54 # maximize the number of A-rank in the first ~ two months
-        self.mid_time_opt_b1proj = katpoint.Timestamp(args.start).secs + 3600 * 24 * 115 # maximize the number of B1-rank in the first ~ three months
+        self.args = args
+        self.set_start(args.start)
         self.filename = [self.configs['imaging'], self.configs['pulsar']]
-        # assert isinstance(self.filename, list) # enforcing the argument to be a list
-        if len(self.filename) > 1:
-            self.data_ = pd.concat([pd.read_csv(self.filename[i]) for i in range(len(self.filename))], axis = 0)
-            self.data_ = self.data_.reset_index(drop=True)
-        else:
-            self.data_ = pd.read_csv(self.filename[0])
-        self.data_.dropna(subset=['lst_start'], inplace=True)
-        self.data_.dropna(subset=['lst_start_end'], inplace=True)
-        self.data = self.data_[(self.data_['state'] != 'DECLINED') & (self.data_['state'] != 'DRAFT')]
-        self.data = self.data.dropna(subset=["simulated_duration"])
-        self.data = self.data.reset_index(drop=True) # reset index
-        self.data['lst_start_secs'] = self.data['lst_start'].map(lambda x: utils.convert_string_to_secs(x))
-        self.data['lst_start_end_secs'] = self.data['lst_start_end'].map(lambda x: utils.convert_string_to_secs(x))
+        # cleaned SBs with their LST in seconds and their grade, compiled once, and the hash identifying them (e.g. in the optimizer history)
+        self.data, self.catalogue_hash = catalogue.load_catalogue(self.configs)
         self.antenna = katpoint.Antenna('Antenna_Position, -30:43:17.3, 21:24:38.5, 1038.0, 12.0')
-        self.dashboard = pd.read_csv(self.configs['dashboard']) # this reads the csv file from Manager Katpaws
-        self.rating = dict(zip(self.dashboard['Proposal Id'], self.dashboard['Grade'])) 
-        self.data['Grade'] = self.data['proposal_id'].apply(lambda x: utils.get_grade(x, self.rating)) 
-        self.dummy = json.load(open('/Users/Sam-Macbook/work/notebook/dummy.json'))
+        self.ephemeris = EphemerisTimeline(self.antenna) # LST and sunrise/sunset, shared by all the simulations
+        self.dummy = json.load(open(self.configs['dummy'])) # record of the idle state of the telescope
         self.data_avsrss = self.data[(self.data['avoid_sunrise_sunset'] == 'Yes') & (self.data['night_obs'] != 'Yes')]
         self.data_night = self.data[(self.data['night_obs'] == 'Yes')]
         self.data_day = self.data[(self.data['avoid_sunrise_sunset'] != 'Yes') & (self.data['night_obs'] != 'Yes')]
+        self.engine_name = self.configs.get('simulation', {}).get('engine', 'array') # 'array' or 'pandas' (reference implementation)
+        self.engine = GreedyEngine(self)
+        self.decision_cache = DecisionCache(self.engine.class_grade, self.engine.class_duration_norm,
+                                            max_entries = self.configs.get('simulation', {}).get('decision_cache', 256)) # 0 disables the cache
+        self.checkpoints = CheckpointTrie(self.engine.class_grade, self.engine.class_duration_norm,
+                                          interval = self.configs.get('simulation', {}).get('checkpoint_interval', 32),
+                                          max_nodes = self.configs.get('simulation', {}).get('checkpoints', 4096)) # 0 disables the checkpoints
+        self.profiler = None # see profiling.attach
+        self.last_evaluation = {'cache': 'off', 'resumed_picks': 0} # how the last simulation was obtained, see simulate_greedy
         
         
+    def set_start(self, start):
+        '''
+        This routine sets the start (string, UTC) from which the long-term score counts the early A-rank and B1-rank SBs.
+        '''
+        self.mid_time_opt_aproj  = katpoint.Timestamp(start).secs + 3600 * 24 * 54 # maximize the number of A-rank in the first ~ two months
+        self.mid_time_opt_b1proj = katpoint.Timestamp(start).secs + 3600 * 24 * 115 # maximize the number of B1-rank in the first ~ three months
+
     def check_lst(self, day, lst_start, lst_end):
-        convert_to_lst = self.antenna.local_sidereal_time(day)
-        lst_now = utils.convert_string_to_secs(str(convert_to_lst))
+        lst_now = self.ephemeris.lst_secs(day)
         if lst_start > lst_end:
             return (lst_start <= lst_now) | (lst_end > lst_now)
         else:
@@ -73,8 +76,7 @@ class Observation:
             Returns:
                     obs_run (dataframe): table
         '''
-        convert_to_lst = self.antenna.local_sidereal_time(katpoint.Timestamp(day))
-        lst_obs = utils.convert_string_to_secs(str(convert_to_lst))
+        lst_obs = self.ephemeris.lst_secs(day)
         data_mid = data[data['lst_start_secs'] > data['lst_start_end_secs']]
         data_nor = data[data['lst_start_secs'] < data['lst_start_end_secs']]
         obs_run_nor = data_nor[(data_nor['lst_start_secs'] <= lst_obs) & (data_nor['lst_start_end_secs'] >= lst_obs)]
@@ -94,64 +96,42 @@ class Observation:
         return obs_run
             
     def check_day_night(self, day):
-        Obs = self.antenna
-        Obs.observer.date = katpoint.Timestamp(day).to_string()
-        sunrise = Obs.observer.previous_rising(ephem.Sun()) 
-        sunset  = Obs.observer.next_setting(ephem.Sun())
-        day_lst = Obs.local_sidereal_time(katpoint.Timestamp(day))
-        sunrise_lst = Obs.local_sidereal_time(katpoint.Timestamp(sunrise))
-        sunset_lst = Obs.local_sidereal_time(katpoint.Timestamp(sunset))
-        sunrise_secs = utils.convert_string_to_secs(str(sunrise_lst))
-        sunset_secs = utils.convert_string_to_secs(str(sunset_lst))
-        day_lst_secs = utils.convert_string_to_secs(str(day_lst))
-        if day_lst_secs > sunrise_secs and day_lst_secs < sunset_secs:
-            day_time = 'daytime'
-        else:
-            day_time = 'nighttime'
-            Obs.observer.date = katpoint.Timestamp(day).to_string()
-            sunrise = Obs.observer.next_rising(ephem.Sun()) 
-            sunset  = Obs.observer.previous_setting(ephem.Sun())
-        return day_time, sunrise, sunset 
+        '''
+        This routine tells whether a given time (UTC seconds) is daytime or nighttime and returns the
+        corresponding sunrise and sunset (UTC seconds). The ephemeris is read from the precomputed timeline.
+        '''
+        return self.ephemeris.day_night(day)
             
     def simulate_schedule(self, start = '2024-03-12 21:00:00', timespan = 24 * 3 * 60, 
-                          method = 'greedy', sb_value = [4,3,2,1], plan = 'long', optim = True):
+                          method = 'greedy', sb_value = [4,3,2,1], plan = 'long', optim = True, engine = None, seed = None, sink = None):
+        '''
+        This routine simulates the schedule from start over timespan (hours). With sink (see export.ScheduleWriter)
+        the schedule is written to it as it is produced instead of being returned (None in place of the table).
+        '''
         assert plan == 'long' or plan == 'short', 'plan has only two values: long or short [as string]'
+        assert method == 'greedy' or method == 'stochastic', 'method has only two values: greedy or stochastic [as string]'
+        engine = self.engine_name if engine is None else engine
+        assert engine == 'array' or engine == 'pandas', 'engine has only two values: array or pandas [as string]'
         dict_priority = utils.assign_ranking(sb_value)
         end = katpoint.Timestamp(start).secs + timespan * 3600
         day = katpoint.Timestamp(start).secs
+        self.ephemeris.extend(day, end)
+        self.last_evaluation = {'cache': 'off', 'resumed_picks': 0}
+        if engine == 'array' and method == 'greedy':
+            result = self.simulate_greedy(day, end, dict_priority, sink)
+            return self.finish_schedule(result, plan, optim, sink) # the table is only built when asked for
+        rng = np.random.default_rng(seed) # the stochastic selection picks uniformly among the SBs that can be run
+        if engine == 'array':
+            result = self.engine.simulate(day, end, dict_priority, rng = rng, sink = sink)
+            return self.finish_schedule(result, plan, optim, sink)
         data_day = self.data_day.copy(deep=True)
         data_night = self.data_night.copy(deep=True)
         data_avsrss = self.data_avsrss.copy(deep=True)
         data_day = data_day.reset_index(drop=True)
         data_night = data_night.reset_index(drop=True)
         data_avsrss = data_avsrss.reset_index(drop=True)
-        df_obs = pd.DataFrame(columns=['Start time (UTC)', 'Start time (LST)','id','description','owner','proposal_id', 'duration', 'product', 'Grade', 'priority', 'avoid_sunrise_sunset', 'night_obs'])
-        if method == 'stochastic':
-            while day <= end:
-                table = self.get_obs_at_time(day, data)
-                if len(table) > 0:
-                    #table.loc[len(table.index)] = self.dummy # insert dummy row for idle state of telescope
-                    table['priority'] = table.apply(lambda x: utils.assign_priority(x), axis = 1)
-                    index = random.sample(range(len(table)), 1)[0]
-                    convert_to_lst = self.antenna.local_sidereal_time(katpoint.Timestamp(day))
-                    lst_obs = str(convert_to_lst)
-                    df_obs.loc[len(df_obs.index)] = [katpoint.Timestamp(day).to_string(), lst_obs, int(table['id'].iloc[index]), 
-                                                 table['description'].iloc[index], table['owner'].iloc[index], table['proposal_id'].iloc[index], 
-                                                 str(datetime.timedelta(seconds=table['simulated_duration'].iloc[index])),
-                                                 table['product'].iloc[index], table['Grade'].iloc[index], table['priority'].iloc[index]]
-                    day += (table['simulated_duration'].iloc[index] + 1800)
-                    data = data[(data['id'] != table['id'].iloc[index])].reset_index(drop=True)
-                else:
-                    table = self.dummy
-                    convert_to_lst = self.antenna.local_sidereal_time(katpoint.Timestamp(day))
-                    lst_obs = str(convert_to_lst)
-                    df_obs.loc[len(df_obs.index)] = [katpoint.Timestamp(day).to_string(), lst_obs, int(2e13), 
-                                                    table['description'], table['owner'], table['proposal_id'], 
-                                                    str(datetime.timedelta(seconds=1800)),
-                                                    table['product'], table['Grade'], -1, 
-                                                    table['avoid_sunrise_sunset'], table['night_obs']]
-                    day += 1800 # no-schedule instead?
-        elif method == 'greedy':
+        df_obs = pd.DataFrame(columns=SCHEDULE_COLUMNS)
+        if method == 'greedy' or method == 'stochastic':
             while day <= end:
                 day_time, sunrise, sunset = self.check_day_night(day) # step 1
                 if day_time == 'daytime': # step 2
@@ -161,14 +141,15 @@ class Observation:
                 table = self.get_obs_at_time(day, data, day_time, sunrise, sunset) # step 3-4, all observations selected in table can be run at this level
                 if len(table) > 0:
                     table['priority'] = table.apply(lambda x: utils.assign_priority(x, dict_priority = dict_priority), axis = 1)
-                    index = table['priority'].idxmax()
+                    index = table['priority'].idxmax() if method == 'greedy' else int(rng.integers(len(table)))
                     convert_to_lst = self.antenna.local_sidereal_time(katpoint.Timestamp(day))
                     lst_obs = str(convert_to_lst)
                     df_obs.loc[len(df_obs.index)] = [katpoint.Timestamp(day).to_string(), lst_obs, table['id'].iloc[index], 
                                                  table['description'].iloc[index], table['owner'].iloc[index], table['proposal_id'].iloc[index], 
                                                  str(datetime.timedelta(seconds=table['simulated_duration'].iloc[index])),
                                                  table['product'].iloc[index], table['Grade'].iloc[index], table['priority'].iloc[index],
-                                                    table['avoid_sunrise_sunset'].iloc[index], table['night_obs'].iloc[index]]
+                                                    table['avoid_sunrise_sunset'].iloc[index], table['night_obs'].iloc[index],
+                                                    day, table['simulated_duration'].iloc[index]]
                     day += (table['simulated_duration'].iloc[index] + 1800) # this is to include the next build
                     if day_time == 'daytime':
                         data_day = data_day[(data_day['id'] != table['id'].iloc[index])].reset_index(drop=True).copy(deep=True)
@@ -184,22 +165,127 @@ class Observation:
                                                     table['description'], table['owner'], table['proposal_id'], 
                                                     str(datetime.timedelta(seconds=1800)),
                                                     table['product'], table['Grade'], -1, 
-                                                    table['avoid_sunrise_sunset'], table['night_obs']]
+                                                    table['avoid_sunrise_sunset'], table['night_obs'], day, 1800]
                     day += 1800
+        score = self.score_schedule(df_obs, plan, optim)
+        if sink is not None:
+            sink.close(frame = df_obs)
+            return score if optim else score[:4] + (None,)
+        return score
+
+    def replica_counts(self, start, timespan, sb_value = [4,3,2,1], seed = None):
+        '''
+        This routine runs one replica of the stochastic selection (seeded) and returns its number of idles,
+        A-rank, B1-rank and B2-rank SBs, without building the schedule table (array engine).
+        '''
+        if self.engine_name == 'pandas':
+            return self.simulate_schedule(start = start, timespan = timespan, method = 'stochastic', sb_value = sb_value, optim = False, seed = seed)[:4]
+        end = katpoint.Timestamp(start).secs + timespan * 3600
+        day = katpoint.Timestamp(start).secs
+        self.ephemeris.extend(day, end)
+        result = self.engine.simulate(day, end, utils.assign_ranking(sb_value), rng = np.random.default_rng(seed))
+        return self.get_score(result.counts, optim = False)
+
+    def simulate_score(self, start, timespan, method = 'greedy', sb_value = [4,3,2,1], plan = 'long', seed = None):
+        '''
+        This routine returns the number of idles, A-rank, B1-rank and B2-rank SBs and the score (cost minimized by the
+        optimizers) of one simulation, from the counters of the array engine (no schedule table is built).
+        '''
+        if self.engine_name == 'pandas':
+            result = self.simulate_schedule(start = start, timespan = timespan, method = method, sb_value = sb_value, plan = plan, optim = False, seed = seed)
+            return result[:4], self.score_schedule(result[4], plan, optim = True)
+        assert method == 'greedy' or method == 'stochastic', 'method has only two values: greedy or stochastic [as string]'
+        end = katpoint.Timestamp(start).secs + timespan * 3600
+        day = katpoint.Timestamp(start).secs
+        self.ephemeris.extend(day, end)
+        self.last_evaluation = {'cache': 'off', 'resumed_picks': 0}
+        dict_priority = utils.assign_ranking(sb_value)
+        if method == 'greedy':
+            result = self.simulate_greedy(day, end, dict_priority)
+        else:
+            result = self.engine.simulate(day, end, dict_priority, rng = np.random.default_rng(seed))
+        return self.get_score(result.counts, plan, optim = False), self.get_score(result.counts, plan, optim = True)
+
+    def finish_schedule(self, result, plan = 'long', optim = True, sink = None):
+        '''
+        This routine returns the score of an array engine simulation, followed by its schedule table with optim = False
+        (None when the schedule went to sink, whose last rows are written here).
+        '''
+        score = self.get_score(result.counts, plan, optim)
+        if sink is not None:
+            sink.close(result.buffer)
+            return score if optim else score + (None,)
+        return score if optim else score + (self.engine.build_schedule(result.buffer),)
+
+    def simulate_greedy(self, day, end, dict_priority, sink = None):
+        '''
+        This routine runs the array engine behind the decision cache and the checkpoints: when the priorities would make
+        the same picks as an earlier simulation of the same horizon, its schedule is reused instead of being simulated again;
+        otherwise the simulation resumes from the deepest checkpoint whose first picks the priorities reproduce.
+        The outcome ('hit' or 'miss' of the cache, number of picks resumed from checkpoints) is kept in last_evaluation.
+        sink is passed to the engine (a reused schedule is written to it as a whole, see finish_schedule).
+        '''
+        use_cache, use_checkpoints = self.decision_cache.max_entries > 0, self.checkpoints.max_nodes > 0
+        if not use_cache and not use_checkpoints:
+            return self.engine.simulate(day, end, dict_priority, sink = sink)
+        coeff = self.engine.coefficients(dict_priority)
+        if use_cache:
+            result = self.decision_cache.lookup((day, end), coeff)
+            if result is not None:
+                self.last_evaluation = {'cache': 'hit', 'resumed_picks': 0}
+                return self.engine.reprioritize(result, coeff)
+            self.last_evaluation = {'cache': 'miss', 'resumed_picks': 0}
+        trace = DecisionTrace(len(self.engine.class_grade))
+        state, on_pick = None, None
+        if use_checkpoints:
+            picks_skipped = self.checkpoints.picks_skipped
+            node = self.checkpoints.resume(day, coeff, end)
+            self.last_evaluation['resumed_picks'] = self.checkpoints.picks_skipped - picks_skipped
+            state = self.checkpoints.state(node, coeff, self.engine)
+            for constraints in self.checkpoints.path_constraints(node):
+                trace.include(*constraints)
+            on_pick = self.checkpoints.recorder(node, trace, 0 if state is None else state.buffer.length).on_pick
+        result = self.engine.simulate(day, end, dict_priority, trace = trace, state = state, on_pick = on_pick, sink = sink)
+        if use_cache:
+            self.decision_cache.store((day, end), coeff, trace, result)
+        return result
+
+    def score_schedule(self, df_obs, plan = 'long', optim = True):
+        '''
+        This routine computes the score of a simulated schedule (table), see get_score.
+        With optim = False the table itself is returned after the counts.
+        '''
+        start_secs = df_obs['start_secs']
+        counts = {'idle': len(df_obs[df_obs['priority'] == -1]),
+                  'A': len(df_obs[df_obs['Grade'] == 'A']),
+                  'B1': len(df_obs[df_obs['Grade'] == 'B1']),
+                  'B2': len(df_obs[df_obs['Grade'] == 'B2']),
+                  'A_early': len(df_obs[(df_obs['Grade'] == 'A') & (start_secs <= self.mid_time_opt_aproj)]),
+                  'B1_early': len(df_obs[(df_obs['Grade'] == 'B1') & (start_secs <= self.mid_time_opt_b1proj)])}
+        score = self.get_score(counts, plan, optim)
+        return score if optim else score + (df_obs,)
+
+    def get_score(self, counts, plan = 'long', optim = True):
+        '''
+        This routine computes the score of a simulated schedule from its counters: number of idles ('idle'),
+        of A/B1/B2-rank SBs ('A', 'B1', 'B2') and of A-rank (B1-rank) SBs started before mid_time_opt_aproj
+        (mid_time_opt_b1proj) ('A_early', 'B1_early').
+        With optim = True it returns the cost minimized by the optimizers, otherwise the number of idles,
+        A-rank, B1-rank and B2-rank SBs.
+        '''
         if plan == 'long':
-            maxim_grade_A = len(df_obs[(df_obs['Grade'] == 'A') & (df_obs['Start time (UTC)'].apply(lambda x: katpoint.Timestamp(x).secs) <= self.mid_time_opt_aproj)]) # optimize the number of A ranked proposal in the first 2 month.
-            maxim_grade_B1 = len(df_obs[(df_obs['Grade'] == 'B1') & (df_obs['Start time (UTC)'].apply(lambda x: katpoint.Timestamp(x).secs) <= self.mid_time_opt_b1proj)]) # optimize the number of B1 ranked proposal in the first 3 months.
-            minim_idles = len(df_obs[df_obs['priority'] == -1])
+            maxim_grade_A = counts['A_early'] # optimize the number of A ranked proposal in the first 2 month.
+            maxim_grade_B1 = counts['B1_early'] # optimize the number of B1 ranked proposal in the first 3 months.
+            minim_idles = counts['idle']
             if optim:
                 return minim_idles / (100 * MAX_NUM_IDLES) + 1.0 / (maxim_grade_A + 1e-6) + 1.0 / (maxim_grade_B1 + 1e-6) # this works well
             else:
-                return minim_idles, len(df_obs[df_obs['Grade'] == 'A']), len(df_obs[df_obs['Grade'] == 'B1']), len(df_obs[df_obs['Grade'] == 'B2']), df_obs
+                return minim_idles, counts['A'], counts['B1'], counts['B2']
         elif plan == 'short':
-            maxim_grade_A = len(df_obs[(df_obs['Grade'] == 'A')]) 
-            maxim_grade_B1 = len(df_obs[(df_obs['Grade'] == 'B1')]) 
-            minim_idles = len(df_obs[df_obs['priority'] == -1])
+            maxim_grade_A = counts['A']
+            maxim_grade_B1 = counts['B1']
+            minim_idles = counts['idle']
             if optim:
                 return minim_idles + 1.0 / (maxim_grade_A + 1e-4) + 1.0 / (maxim_grade_B1 + 1e-4)
             else:
-                return minim_idles, len(df_obs[df_obs['Grade'] == 'A']), len(df_obs[df_obs['Grade'] == 'B1']), len(df_obs[df_obs['Grade'] == 'B2']), df_obs
-        
\ No newline at end of file
+                return minim_idles, counts['A'], counts['B1'], counts['B2']
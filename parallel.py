@@ -0,0 +1,142 @@
+import multiprocessing as mp
+import time
+
+
+worker_obs = None # Observation used by the current worker process
+
+
+def init_worker(configs, args):
+    '''
+    This routine loads the Observation once per worker (used when the workers are not forked, see use_fork).
+    '''
+    global worker_obs
+    import observation as Obs
+    worker_obs = Obs.Observation(configs, args)
+
+
+def use_fork():
+    '''
+    This routine tells whether the workers are forked: only where fork is the default start method (Linux up to
+    Python 3.13); elsewhere (e.g. macOS, where forking after the system frameworks are loaded is unsafe) each
+    worker loads its own Observation (see init_worker).
+    '''
+    return mp.get_start_method() == 'fork'
+
+
+def simulate(kwargs):
+    return worker_obs.simulate_schedule(**kwargs)
+
+
+def replica(kwargs):
+    return worker_obs.replica_counts(**kwargs)
+
+
+def evaluate(obs, kwargs):
+    '''
+    This routine runs simulate_schedule and returns the score together with how it was obtained
+    (see Observation.last_evaluation) and its wall time (seconds), for the evaluation traces.
+    '''
+    start_time = time.perf_counter()
+    score = obs.simulate_schedule(**kwargs)
+    return score, obs.last_evaluation, time.perf_counter() - start_time
+
+
+def simulate_traced(kwargs):
+    return evaluate(worker_obs, kwargs)
+
+
+def evaluate_tasks(obs, pool, tasks, trace = None, history = None):
+    '''
+    This routine returns the scores of simulate_schedule tasks (keyword arguments), evaluated by pool (an EvaluationPool)
+    when there is one and more than one task, by obs otherwise. Every evaluation is written to trace if given
+    (see profiling.EvaluationTrace) and stored in history if given (see history.HistoryStore).
+    '''
+    if trace is None:
+        if pool is not None and len(tasks) > 1:
+            scores = pool.map(tasks)
+        else:
+            scores = [obs.simulate_schedule(**task) for task in tasks]
+    else:
+        if pool is not None and len(tasks) > 1:
+            results = pool.map(tasks, traced = True)
+        else:
+            results = [evaluate(obs, task) for task in tasks]
+        for task, (score, evaluation, wall_time) in zip(tasks, results):
+            trace.write(task['sb_value'], score, wall_time, dict(evaluation, timespan = task['timespan']))
+        scores = [score for score, evaluation, wall_time in results]
+    if history is not None and len(tasks) > 0:
+        history.add(tasks, scores)
+    return scores
+
+
+class EvaluationPool:
+    def __init__(self, obs, num_workers):
+        '''
+        Usage:
+
+            pool = EvaluationPool(obs, num_workers) # obs is an instance of Observation
+            scores = pool.map([{'start': start, 'timespan': timespan, 'sb_value': x, ...}, ...])
+            pool.close()
+
+            Process pool evaluating simulate_schedule calls in parallel. Each worker holds one Observation for its
+            whole life: where fork is the default start method (see use_fork) the workers are forked from the current
+            process, so the catalogue arrays and the ephemeris timeline are shared read-only (copy-on-write) instead
+            of being pickled for every task; otherwise each worker builds its own Observation from obs.configs and obs.args. Only the keyword
+            arguments of simulate_schedule and the scores travel between processes.
+        '''
+        global worker_obs
+        self.num_workers = num_workers
+        if use_fork():
+            worker_obs = obs
+            self.pool = mp.Pool(num_workers)
+        else:
+            self.pool = mp.Pool(num_workers, initializer = init_worker, initargs = (obs.configs, obs.args))
+
+    def map(self, tasks, traced = False):
+        '''
+        This routine returns the scores of the tasks, or (score, evaluation, wall time) tuples when traced (see evaluate).
+        '''
+        return self.pool.map(simulate_traced if traced else simulate, tasks, chunksize = 1)
+
+    def replicas(self, tasks):
+        '''
+        This routine returns an iterator over the counts of stochastic replicas (see Observation.replica_counts),
+        in order of completion.
+        '''
+        return self.pool.imap_unordered(replica, tasks, chunksize = 1)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+class AffinityPool:
+    def __init__(self, obs, num_workers):
+        '''
+        Usage:
+
+            pool = AffinityPool(obs, num_workers) # same interface as EvaluationPool
+            scores = pool.map(tasks)
+            pool.close()
+
+            Pool of num_workers single-process EvaluationPools where every task goes to the worker chosen by its
+            parameters (sb_value): evaluations of the same parameters, e.g. on longer horizons, run where the decision
+            cache and the checkpoints of their earlier simulations are.
+        '''
+        self.pools = [EvaluationPool(obs, 1) for i in range(num_workers)]
+
+    def map(self, tasks, traced = False):
+        groups = [[] for pool in self.pools]
+        for i, task in enumerate(tasks):
+            groups[hash(tuple(float(x) for x in task['sb_value'])) % len(self.pools)].append(i)
+        pending = [(group, pool.pool.map_async(simulate_traced if traced else simulate, [tasks[i] for i in group], chunksize = 1))
+                   for pool, group in zip(self.pools, groups) if len(group) > 0]
+        results = [None] * len(tasks)
+        for group, result in pending:
+            for i, value in zip(group, result.get()):
+                results[i] = value
+        return results
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
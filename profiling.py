@@ -0,0 +1,112 @@
+import json
+import time
+from tabulate import tabulate
+
+
+class Profiler:
+    def __init__(self):
+        '''
+        Usage:
+
+            profiler = Profiler()
+            profiler.wrap(obj, 'method', 'phase') # obj.method is now timed under phase
+            profiler.count('picks', 3)
+            print(profiler.summary())
+
+            Cumulative timers (seconds and calls per phase) and counters. Methods are timed by replacing them on the
+            instance with a timed wrapper, so nothing changes (and nothing is paid) for objects that are not wrapped.
+            Nested phases are timed on their own: the time of a phase includes the time of the phases it calls.
+        '''
+        self.timers = {}
+        self.counters = {}
+
+    def wrap(self, obj, method, phase, on_result = None):
+        '''
+        This routine times every call of obj.method under phase; on_result(result) is called after each call if given.
+        '''
+        function = getattr(obj, method)
+        timer = self.timers.setdefault(phase, [0.0, 0])
+        def timed(*args, **kwargs):
+            start_time = time.perf_counter()
+            result = function(*args, **kwargs)
+            timer[0] += time.perf_counter() - start_time
+            timer[1] += 1
+            if on_result is not None:
+                on_result(result)
+            return result
+        setattr(obj, method, timed)
+
+    def count(self, name, value = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        return {'timers': {phase: {'seconds': seconds, 'calls': calls} for phase, (seconds, calls) in self.timers.items()},
+                'counters': dict(self.counters)}
+
+    def summary(self):
+        rows = [[phase, calls, seconds, 1e6 * seconds / calls if calls > 0 else 0.0] for phase, (seconds, calls) in self.timers.items()]
+        table = tabulate(rows, headers=['phase', 'calls', 'total (s)', 'per call (us)'], tablefmt='grid', floatfmt='.3f')
+        counters = tabulate(sorted(self.counters.items()), headers=['counter', 'value'], tablefmt='grid')
+        return table + '\n' + counters
+
+
+def attach(obs):
+    '''
+    Usage:
+
+        obs.profiler = attach(obs) # obs is an instance of Observation
+
+        Instruments an Observation: whole simulations ('simulate_schedule'), the greedy engine ('engine'), the ephemeris
+        ('day_night', 'lst'), the selection of the SBs that can be run ('filtering' for the array engine, 'get_obs_at_time'
+        for the pandas implementation), the reuse of earlier simulations ('decision_cache', 'checkpoints'), the scoring
+        ('scoring') and the building of schedule tables ('schedule_table'). The counters hold the number of steps of the
+        greedy loops (split in picks and idles) and of decision cache hits and misses. Evaluations run by worker
+        processes (see parallel.EvaluationPool) are not included.
+    '''
+    profiler = Profiler()
+    def count_step(candidates):
+        profiler.count('steps')
+        profiler.count('picks' if len(candidates) > 0 else 'idles')
+    profiler.wrap(obs, 'simulate_schedule', 'simulate_schedule')
+    profiler.wrap(obs.engine, 'simulate', 'engine')
+    profiler.wrap(obs.engine, 'build_schedule', 'schedule_table')
+    profiler.wrap(obs, 'check_day_night', 'day_night')
+    profiler.wrap(obs.ephemeris, 'lst_secs', 'lst')
+    for pool in obs.engine.pools.values():
+        profiler.wrap(pool, 'candidates', 'filtering', on_result = count_step)
+    profiler.wrap(obs, 'get_obs_at_time', 'get_obs_at_time', on_result = count_step)
+    profiler.wrap(obs.decision_cache, 'lookup', 'decision_cache', on_result = lambda result: profiler.count('cache_hits' if result is not None else 'cache_misses'))
+    profiler.wrap(obs.checkpoints, 'resume', 'checkpoints')
+    profiler.wrap(obs.checkpoints, 'state', 'checkpoints')
+    profiler.wrap(obs, 'get_score', 'scoring')
+    profiler.wrap(obs, 'score_schedule', 'scoring')
+    return profiler
+
+
+class EvaluationTrace:
+    def __init__(self, filename, algo):
+        '''
+        Usage:
+
+            trace = EvaluationTrace('trace.jsonl', 'bo')
+            trace.write(params, score, wall_time, evaluation) # evaluation: see Observation.last_evaluation
+            trace.close()
+
+            Streaming trace of the evaluations of an optimizer, one json record per line, written as they happen
+            (the file can be followed during a long run): optimizer, index of the evaluation, parameters (sb_value),
+            score, wall time (seconds), horizon (hours), cache outcome ('hit' or 'miss' of the decision cache, 'fitness' for an
+            individual already scored by the genetic algorithm, 'off' without cache) and picks resumed from checkpoints.
+        '''
+        self.fp = open(filename, 'a', buffering=1)
+        self.algo = algo
+        self.evaluations = 0
+
+    def write(self, params, score, wall_time, evaluation):
+        record = {'algo': self.algo, 'evaluation': self.evaluations, 'time': time.time(),
+                  'params': [float(p) for p in params], 'score': float(score), 'wall_time': wall_time}
+        record.update(evaluation)
+        self.fp.write(json.dumps(record) + '\n')
+        self.evaluations += 1
+
+    def close(self):
+        self.fp.close()
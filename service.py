@@ -0,0 +1,232 @@
+import asyncio
+import argparse
+import concurrent.futures
+import json
+import os
+import yaml
+from collections import OrderedDict
+import observation as Obs
+import catalogue
+import parallel
+
+
+SCORE_NAMES = ['idle', 'A', 'B1', 'B2']
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def serve(request):
+    '''
+    This routine runs a /score or /schedule request in a worker (see parallel.worker_obs): score (cost minimized by the
+    optimizers) and counts for /score, counts and schedule table (list of records) for /schedule. Both come from
+    one simulation, so that they describe the same schedule (e.g. a stochastic one).
+    '''
+    obs = parallel.worker_obs
+    obs.set_start(request['start'])
+    kwargs = {'start': request['start'], 'timespan': request['timespan'], 'method': request['selection'],
+              'sb_value': request['sb_value'], 'plan': request['plan'], 'seed': request['seed']}
+    if request['kind'] == 'score':
+        counts, score = obs.simulate_score(**kwargs) # from the counters, the table is not built
+        return {'counts': dict(zip(SCORE_NAMES, [int(c) for c in counts])), 'score': float(score)}
+    result = obs.simulate_schedule(optim = False, **kwargs)
+    response = {'counts': dict(zip(SCORE_NAMES, [int(c) for c in result[:4]]))}
+    response['schedule'] = json.loads(result[4].to_json(orient = 'records'))
+    return response
+
+
+def source_signature(configs):
+    '''
+    This routine returns the size and modification time of the source files of the catalogue.
+    '''
+    signature = []
+    for key in ['imaging', 'pulsar', 'dashboard', 'dummy']:
+        stat = os.stat(configs[key])
+        signature.append((stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def content_hash(configs, catalogue_hash = None):
+    '''
+    This routine returns the hash of the content of the source files: catalogue (see catalogue.catalogue_hash,
+    unless already known) and record of the idle state.
+    '''
+    if catalogue_hash is None:
+        catalogue_hash = catalogue.catalogue_hash(configs)
+    return catalogue_hash + catalogue.source_hash([configs['dummy']])
+
+
+class SchedulingService:
+    def __init__(self, configs, args):
+        '''
+        Usage:
+
+            service = SchedulingService(configs, args) # configs from config.yml, args.start the default start
+            asyncio.run(service.serve_forever())
+
+            Resident scheduling service: the catalogue stays loaded in an Observation shared by configs['service']['num_workers']
+            worker processes, and the requests are answered over localhost HTTP (or a unix socket):
+
+                POST /score    {"start": ..., "plan": "long", "selection": "greedy", "sb_value": [4, 3, 2, 1]}
+                POST /schedule (same body; "timespan" in hours and "seed" of the stochastic selection are optional)
+                GET  /status
+
+            Responses are kept in an LRU cache of configs['service']['cache_entries'] entries, and concurrent identical
+            requests share one simulation (unseeded stochastic requests are always simulated). The catalogue is reloaded
+            in the background when its source files change (content hash), the requests meanwhile use the current one.
+        '''
+        self.configs = configs
+        self.args = args
+        self.service = configs['service']
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.lock = asyncio.Lock()
+        self.executor = None
+        self.install(source_signature(self.configs), Obs.Observation(self.configs, self.args))
+
+    def install(self, signature, obs):
+        '''
+        This routine starts the workers on a loaded catalogue (obs); the workers of the previous one finish their
+        simulations and exit.
+        '''
+        if self.executor is not None:
+            self.executor.shutdown(wait = False)
+        self.signature = signature
+        self.obs = obs
+        self.content = content_hash(self.configs, obs.catalogue_hash)
+        self.cache.clear()
+        if parallel.use_fork():
+            parallel.worker_obs = self.obs # inherited by the forked workers
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.service['num_workers'])
+        else:
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.service['num_workers'], initializer = parallel.init_worker,
+                                                                   initargs = (self.configs, self.args))
+
+    def load(self):
+        '''
+        This routine returns a new Observation if the content of the source files changed, None otherwise
+        (run outside the event loop: hashing and loading a catalogue take a while).
+        '''
+        if content_hash(self.configs) == self.content:
+            return None
+        return Obs.Observation(self.configs, self.args)
+
+    async def check_catalogue(self):
+        signature = source_signature(self.configs)
+        if signature == self.signature or self.lock.locked(): # unchanged, or being reloaded
+            return
+        async with self.lock:
+            obs = await asyncio.get_running_loop().run_in_executor(None, self.load)
+            if obs is None:
+                self.signature = signature # touched but unchanged
+                return
+            self.install(signature, obs)
+            self.reloads += 1
+
+    def parse(self, kind, body):
+        request = json.loads(body) if body else {}
+        plan = request.get('plan', 'long')
+        assert plan == 'long' or plan == 'short', 'plan has only two values: long or short [as string]'
+        sb_value = [float(x) for x in request.get('sb_value', [4, 3, 2, 1])]
+        assert len(sb_value) == 4, 'sb_value has four values: coefficients of the A, B1, B2 and ungraded SBs'
+        return {'kind': kind, 'start': request.get('start', self.args.start), 'plan': plan,
+                'selection': request.get('selection', 'greedy'), 'sb_value': sb_value,
+                'timespan': float(request.get('timespan', self.configs['plan'][plan])), 'seed': request.get('seed')}
+
+    async def respond(self, kind, body):
+        await self.check_catalogue()
+        request = self.parse(kind, body)
+        if request['selection'] == 'stochastic' and request['seed'] is None:
+            self.misses += 1
+            return await asyncio.get_running_loop().run_in_executor(self.executor, serve, request) # a new draw every time
+        key = (self.content, json.dumps(request, sort_keys = True))
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return self.cache[key]
+        self.misses += 1
+        if key not in self.pending:
+            self.pending[key] = asyncio.get_running_loop().run_in_executor(self.executor, serve, request)
+        try:
+            response = await self.pending[key]
+        finally:
+            self.pending.pop(key, None)
+        self.cache[key] = response
+        while len(self.cache) > self.service['cache_entries']:
+            self.cache.popitem(last = False)
+        return response
+
+    def status(self):
+        return {'catalogue': self.obs.catalogue_hash, 'sbs': len(self.obs.data), 'workers': self.service['num_workers'],
+                'cache': {'entries': len(self.cache), 'hits': self.hits, 'misses': self.misses}, 'reloads': self.reloads}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, version = line.decode().split()
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode().strip()
+                    if not line:
+                        break
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, response = await self.route(method, path, body)
+                payload = json.dumps(response).encode()
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                              % (status, REASONS[status], len(payload))).encode() + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        path = path.split('?')[0]
+        if path == '/status':
+            return 200, self.status()
+        if path not in ['/score', '/schedule']:
+            return 404, {'error': 'unknown path %s' % path}
+        if method != 'POST':
+            return 405, {'error': '%s expects POST' % path}
+        try:
+            return 200, await self.respond(path[1:], body)
+        except (AssertionError, ValueError, KeyError, TypeError) as error:
+            return 400, {'error': str(error)}
+        except Exception as error:
+            return 500, {'error': repr(error)}
+
+    async def serve_forever(self):
+        if self.service.get('socket'):
+            server = await asyncio.start_unix_server(self.handle, path = self.service['socket'])
+            print('serving on unix socket %s' % self.service['socket'])
+        else:
+            server = await asyncio.start_server(self.handle, self.service['host'], self.service['port'])
+            print('serving on http://%s:%d' % (self.service['host'], self.service['port']))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait = True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scheduling service')
+    parser.add_argument('--config', type = str, default = 'config.yml', help = 'configuration file')
+    parser.add_argument('--start', type = str, default = '2024-10-07 06:00:00', help = 'default start time of the requests')
+    parser.add_argument('--port', type = int, default = None, help = 'localhost port (overrides config.yml)')
+    parser.add_argument('--socket', type = str, default = None, help = 'unix socket path (overrides config.yml)')
+    args = parser.parse_args()
+    configs = yaml.safe_load(open(args.config))
+    if args.port is not None:
+        configs['service']['port'] = args.port
+    if args.socket is not None:
+        configs['service']['socket'] = args.socket
+    asyncio.run(SchedulingService(configs, args).serve_forever())
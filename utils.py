@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 import katpoint
 
 NORMALIZE_TIME = 3600 * 8
@@ -20,6 +21,13 @@ def convert_string_to_secs(lst_str):
     mins = lst_str.split(':')[1]
     return 3600 * int(hours) + 60 * int(mins)
 
+def convert_strings_to_secs(lst_series):
+    '''
+    Vectorized version of convert_string_to_secs for a pandas Series of lst strings
+    '''
+    parts = lst_series.astype(str).str.split(':', expand=True)
+    return 3600 * parts[0].astype(int) + 60 * parts[1].astype(int)
+
 def get_grade(x, dict_):
     '''
     This routine is used to read the value of a dictionary dict_ corresponding to a key x.
@@ -34,29 +42,46 @@ def get_duration_secs(timestr):
     ftr = [3600,60,1]
     return sum([a*b for a,b in zip(ftr, map(int,timestr.split(':')))])
 
+def get_schedule_secs(table):
+    '''
+    This routine returns the start (UTC seconds) and duration (secs) of the SBs of a schedule table as arrays,
+    read from its numeric columns, or parsed at once from the string columns of tables saved without them
+    '''
+    if 'start_secs' in table and 'duration_secs' in table:
+        return table['start_secs'].to_numpy(dtype=float), table['duration_secs'].to_numpy(dtype=float)
+    start = pd.to_datetime(table['Start time (UTC)']).to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+    duration = pd.to_timedelta(table['duration'].astype(str).str.replace(r' days?, ', ' days ', regex=True)).dt.total_seconds()
+    return start, duration.to_numpy(dtype=float)
+
 def get_schedule_score(table):
     '''
     This routine is used to compute the score of a proposed schedule 
     within a given timespan
     '''
-    len_table = len(table)
+    start, duration = get_schedule_secs(table)
+    idle = (table['Grade'] == 'Idle').to_numpy()
     # compute the total duration of an entire table
-    timestr = table['duration'].iloc[-1]
-    initial_time = katpoint.Timestamp(table['Start time (UTC)'].iloc[0])
-    end_time = katpoint.Timestamp(table['Start time (UTC)'].iloc[-1]) + get_duration_secs(timestr)
-    total_duration = end_time - initial_time - 1800 # to account for the build of the first SB in the table
-    # normalize the length of an SB with the total length from the table
-    normalize_length_sb = {int(table['id'].iloc[i]): (get_duration_secs(table['duration'].iloc[i]) / total_duration, table['priority'].iloc[i]) for i in range(len_table) if table['Grade'].iloc[i] != 'Idle'}
+    total_duration = start[-1] + duration[-1] - start[0] - 1800 # to account for the build of the first SB in the table
+    # length of the SBs normalized with the total length from the table, weighted by their priority
+    score = np.sum(duration[~idle] / total_duration * table['priority'].to_numpy(dtype=float)[~idle])
     # get the no-schedule score
-    score_nosched = sum([-1800/total_duration for i in range(len_table) if table['Grade'].iloc[i] == 'Idle'])
-    # get the total score
-    score = sum([v[0]*v[1] for k,v in normalize_length_sb.items()])
+    score_nosched = -1800 / total_duration * idle.sum()
     # COMPUTING THE TELESCOPE USAGE
-    # number of actual obs SBs
-    number_sbs = len(table)# this should include Idle since they are in the list....len(table[table['Grade'] != 'Idle'])
-    number_idle = len(table[table['Grade'] == 'Idle'])
-    #print(number_idle, number_sbs)
+    number_sbs = len(table) # this includes Idle since they are in the list
+    number_idle = idle.sum()
     total_time_loss = number_sbs * 1800 + number_idle * 3600
     usage = 100 * (1 - total_time_loss / total_duration)
     return score + score_nosched, usage
 
+def get_utilisation(table, by = 'Grade'):
+    '''
+    This routine computes the utilisation of a proposed schedule per grade (by = 'Grade') or per proposal
+    (by = 'proposal_id'): number of SBs, time observed (secs) and fraction of the timespan of the table
+    '''
+    start, duration = get_schedule_secs(table)
+    total_duration = start[-1] + duration[-1] - start[0]
+    keys = table[by].fillna('None').astype(str).to_numpy()
+    usage = pd.DataFrame({by: keys, 'duration_secs': duration}).groupby(by)['duration_secs'].agg(['size', 'sum'])
+    usage.columns = ['sbs', 'observed_secs']
+    usage['fraction'] = usage['observed_secs'] / total_duration
+    return usage.sort_values('observed_secs', ascending=False)
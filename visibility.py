@@ -0,0 +1,50 @@
+import numpy as np
+
+
+LST_BIN = 60 # LST (secs) is handled at minute resolution, see utils.convert_string_to_secs
+NUM_BINS = 24 * 60 + 1 # the last bin holds LST = 24:00 (ephem may round 23:59:59.99x up)
+
+
+class LSTIndex:
+    def __init__(self, start, end, duration):
+        '''
+        Usage:
+
+            index = LSTIndex(lst_start_secs, lst_start_end_secs, simulated_duration) # arrays of the same length
+            positions = index.lookup(lst, max_length)
+
+            Visibility index over the LST windows of a set of SBs. For every LST minute it stores the SBs that
+            can be run at that LST, sorted by duration, so that a lookup is one binary search (the duration cut)
+            followed by a slice. Windows wrapping past 24h LST (start > end) are handled when the index is built,
+            with the same conditions as Observation.get_obs_at_time.
+        '''
+        lst = np.arange(NUM_BINS) * LST_BIN
+        wrap = start > end
+        normal = start < end
+        positions, durations, offsets = [], [], [0]
+        for value in lst:
+            visible = (normal & (start <= value) & (end >= value)) | (wrap & ((start <= value) | (end > value)))
+            pos = np.flatnonzero(visible)
+            pos = pos[np.argsort(duration[pos], kind='stable')]
+            positions.append(pos)
+            durations.append(duration[pos])
+            offsets.append(offsets[-1] + len(pos))
+        self.positions = np.concatenate(positions).astype(np.int64)
+        self.durations = np.concatenate(durations).astype(float)
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+    def covers(self, lst):
+        '''
+        This routine tells whether an LST (secs) can be looked up in the index.
+        '''
+        return lst % LST_BIN == 0 and 0 <= lst < NUM_BINS * LST_BIN
+
+    def lookup(self, lst, max_length):
+        '''
+        This routine returns the positions of the SBs visible at a given LST (secs) and lasting at most
+        max_length seconds, sorted by duration.
+        '''
+        b = int(lst) // LST_BIN
+        lo = self.offsets[b]
+        hi = lo + np.searchsorted(self.durations[lo:self.offsets[b + 1]], max_length, side='right')
+        return self.positions[lo:hi]